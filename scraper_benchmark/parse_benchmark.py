@@ -0,0 +1,50 @@
+"""
+CPU cost of turning stored pages into markdown and links.
+
+Compares the old two-parse path (a BeautifulSoup tree for links, markdownify's own
+parse for the markdown) with the single-parse one in src/html_parse.py.
+
+    python -m scraper_benchmark.parse_benchmark [rounds]
+"""
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+
+from src.html_parse import extract_links, parse_page, TREE_BUILDER
+
+SOURCE_DIR = Path(__file__).parent / "source_html"
+BASE_URL = "https://docs.stripe.com/"
+
+
+def two_parses(html: str, base_url: str):
+    soup = BeautifulSoup(html, 'html.parser')
+    links = {urljoin(base_url, a.get('href')).split('#')[0] for a in soup.find_all('a')}
+
+    return md(html), {l for l in links if l.startswith(base_url)}
+
+
+def timed(fn, pages, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        results = [fn(html, BASE_URL) for html in pages]
+
+    return (time.process_time() - start) / rounds, results
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    pages = [p.read_text(encoding="utf-8") for p in sorted(SOURCE_DIR.glob("*.html"))]
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / 1e6:.1f} MB, tree builder: {TREE_BUILDER}")
+
+    old_s, old = timed(two_parses, pages, rounds)
+    new_s, new = timed(parse_page, pages, rounds)
+    links_s, links = timed(extract_links, pages, rounds)
+
+    print(f"two parses (old):      {old_s:.2f}s CPU per round")
+    print(f"parse_page:            {new_s:.2f}s CPU per round ({old_s / new_s:.1f}x)")
+    print(f"extract_links only:    {links_s:.2f}s CPU per round (cached markdown)")
+    print(f"same links: {all(a[1] == b[1] == c for a, b, c in zip(old, new, links))}")
@@ -1,4 +1,3 @@
-from requests import get, RequestException
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
 from markdownify import markdownify as md
@@ -7,16 +6,9 @@ import re
 
 from time import sleep
 
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver import Chrome
-
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
 from src.scraper.eval_db.db_utils import get_page_by_url
+from src.fetch import fetch, FetchError
+from src.browser import default_browser_pool
 
 
 def _shrink_entry(text: str) -> str:
@@ -26,7 +18,7 @@ def _shrink_entry(text: str) -> str:
     return re.sub(r"  +", " ", shrunk)
 
 
-def bfs_site(starting_url: str, filter_fn, domain_url= "/", auth_info=None, slowdown_s: float = 0.01, use_db=False, log=True) -> dict[str, str]:
+def bfs_site(starting_url: str, filter_fn, domain_url= "/", auth_info=None, slowdown_s: float = 0.01, use_db=False, log=True, use_browser=True) -> dict[str, str]:
     """
     Returns all pages found on the given site labeled by URL.
     domain_url speficies our 'root', because just '/' to determine internal links will lead to nightmares processing github.com/documentation.
@@ -43,7 +35,10 @@ def bfs_site(starting_url: str, filter_fn, domain_url= "/", auth_info=None, slow
             print(f"Processing {len(links)} links...")
             print("Processing", link)
 
-        html = get_content(link, auth_info) if not use_db else get_content_local(link)
+        if use_db:
+            html = get_content_local(link)
+        else:
+            html = get_content(link, auth_info) if use_browser else get_content_no_sel(link, auth_info)
 
         cleaned_html = _shrink_entry(html)
 
@@ -62,43 +57,22 @@ def bfs_site(starting_url: str, filter_fn, domain_url= "/", auth_info=None, slow
     }
 
 
-# def get_content(url: str, auth_info=None) -> str:
-#     try:
-#         r = get(url)
-#
-#         if not r.status_code == 200:
-#             print(f"Couldn't access page: {url} (HTTP {r.status_code})")
-#             return ""
-#
-#         return r.content
-#     except RequestException as e:
-#         print(f"Couldn't access page: {url}, {e}")
-#
-#         return ""
-
-def get_content(url: str, auth_info=None):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-
-
-    service = Service(ChromeDriverManager().install())
-    driver = Chrome(service=service, options=chrome_options)
-
+def get_content_no_sel(url: str, auth_info=None) -> str:
     try:
-        driver.get(url)
+        r = fetch(url)
 
-        WebDriverWait(driver, 100).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+        if not r.status_code == 200:
+            print(f"Couldn't access page: {url} (HTTP {r.status_code})")
+            return ""
 
-        content = driver.page_source
-    finally:
-        driver.quit()
+        return r.text
+    except FetchError as e:
+        print(f"Couldn't access page: {url}, {e}")
 
-    return content
+        return ""
+
+def get_content(url: str, auth_info=None):
+    return default_browser_pool().render(url)
 
 def get_content_local(url: str):
     return get_page_by_url(url)
@@ -0,0 +1,137 @@
+import re
+import threading
+from collections import Counter
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+# Site chrome that never holds endpoint docs, removed from every page.
+CHROME_SELECTOR = "nav, footer, [role=navigation], [role=contentinfo]"
+# Whole id/class tokens only, a section with id "create-a-consent" is an endpoint.
+CHROME_NAMES = re.compile(r"^(cookie-?(banner|consent|notice|bar)|consent-?banner|gdpr-?banner|onetrust.*|"
+                          r"breadcrumbs?|skip-?link|version-?(picker|select|switch))$", re.I)
+
+# Elements that can be a repeated template block. Layout blocks only count outside the content root.
+CHROME_TAGS = {"nav", "header", "footer", "aside"}
+LAYOUT_TAGS = {"div", "section"}
+CONTENT_TAGS = {"main", "article"}
+PROSE_TAGS = {"p", "table", "ul", "ol", "dl", "pre"}  # Docs, never template inside the content root.
+KEEP_TAGS = {"html", "body", *CONTENT_TAGS}
+HIDDEN_TAGS = {"script", "style", "noscript", "template"}  # Their text never reaches the markdown.
+
+CHARS_PER_TOKEN = 4  # Rough, good enough to report savings without pulling in a tokenizer.
+
+
+class TemplateDetector:
+    """
+    Strips boilerplate from the pages of one crawl before they are converted to markdown.
+
+    Site chrome (nav, footer, cookie banners, version pickers) is dropped outright. Chrome
+    that's only recognized by its id or class has to sit outside the content root and hold
+    no paragraphs, tables or lists. Chrome containers (header, aside) and, on pages with a
+    <main> or <article>, the layout blocks outside of it are fingerprinted by their DOM path
+    plus a hash of their whole subtree. Blocks whose fingerprint already showed up on
+    `min_pages` pages of this crawl are dropped as template, e.g. sidebars and "Was this
+    page helpful?" widgets. Inside the content root a block holding paragraphs, tables or
+    lists is never template, shared parameter tables are docs too. Template is left alone
+    on pages where it's all there is (the same page under another URL).
+
+    Counting is online, so the first few pages of a site still carry their template.
+    Thread-safe, one detector is shared by all crawl workers.
+    """
+
+    def __init__(self, min_pages: int = 3, min_chars: int = 20) -> None:
+        self.min_pages = min_pages
+        self.min_chars = min_chars
+
+        self._seen: Counter[tuple[str, int]] = Counter()
+        self._lock = threading.Lock()
+
+        self.pages = 0
+        self.total_chars = 0
+        self.removed_chars = 0
+
+    def _fingerprints(self, soup: BeautifulSoup) -> tuple[dict[int, tuple[str, int]], dict[int, int]]:
+        """DOM path + subtree hash and text length of every block, in one forward and one backward pass."""
+        nodes = [soup, *soup.descendants]
+        paths = {id(soup): ""}
+        in_content = {id(soup): False}
+
+        for node in nodes[1:]:
+            if isinstance(node, Tag):
+                paths[id(node)] = paths[id(node.parent)] + "/" + node.name
+                in_content[id(node)] = in_content[id(node.parent)] or node.parent.name in CONTENT_TAGS
+
+        has_root = soup.find(CONTENT_TAGS) is not None
+        hashes, lengths, prose = {}, {}, set()
+        # Children come after their parent in document order, so going backwards they're done first.
+        for node in reversed(nodes):
+            if isinstance(node, Tag):
+                parts = [hashes[id(c)] for c in node.children if id(c) in hashes]
+                hashes[id(node)] = hash((node.name, *parts))
+                lengths[id(node)] = sum(lengths.get(id(c), 0) for c in node.children)
+                if node.name in PROSE_TAGS or any(id(c) in prose for c in node.children):
+                    prose.add(id(node))
+            elif (isinstance(node, NavigableString) and not isinstance(node, Comment)
+                  and node.parent.name not in HIDDEN_TAGS):
+                text = node.strip()
+                if text:
+                    hashes[id(node)] = hash(text)
+                    lengths[id(node)] = len(text)
+
+        def candidate(node: Tag) -> bool:
+            if in_content[id(node)]:
+                return node.name in CHROME_TAGS and id(node) not in prose
+            return node.name in CHROME_TAGS or (has_root and node.name in LAYOUT_TAGS)
+
+        blocks = {id(node): (paths[id(node)], hashes[id(node)]) for node in nodes
+                  if isinstance(node, Tag) and lengths[id(node)] >= self.min_chars and candidate(node)}
+
+        return blocks, lengths
+
+    def strip(self, soup: BeautifulSoup) -> None:
+        """Remove chrome and known template blocks from `soup` in place."""
+        removed = 0
+
+        named = soup.find_all(attrs={"id": CHROME_NAMES}) + soup.find_all(attrs={"class": CHROME_NAMES})
+        chrome = soup.select(CHROME_SELECTOR) + [element for element in named
+                                                 if element.find_parent(CONTENT_TAGS) is None
+                                                 and element.find(PROSE_TAGS) is None]
+        for element in chrome:
+            if element.name not in KEEP_TAGS and not element.decomposed:
+                removed += len(element.get_text("", strip=True))
+                element.decompose()
+
+        blocks, lengths = self._fingerprints(soup)
+        page_chars = removed + lengths[id(soup)]
+
+        with self._lock:
+            # Only once per page, a list repeated inside one page isn't template.
+            self._seen.update(set(blocks.values()))
+            template = {key for key, fingerprint in blocks.items() if self._seen[fingerprint] >= self.min_pages}
+
+        # Outermost template blocks only, their insides go with them.
+        outermost, queue = [], [soup]
+        while queue:
+            for child in queue.pop().children:
+                if isinstance(child, Tag):
+                    if id(child) in template and child.name not in KEEP_TAGS:
+                        outermost.append(child)
+                    else:
+                        queue.append(child)
+
+        template_chars = sum(lengths[id(block)] for block in outermost)
+        if lengths[id(soup)] - template_chars >= self.min_chars:
+            for block in outermost:
+                block.decompose()
+            removed += template_chars
+
+        with self._lock:
+            self.pages += 1
+            self.total_chars += page_chars
+            self.removed_chars += removed
+
+    def report(self) -> str:
+        saved = self.removed_chars // CHARS_PER_TOKEN
+        share = self.removed_chars / self.total_chars if self.total_chars else 0
+
+        return f"Boilerplate: ~{saved:,} tokens stripped from {self.pages} pages ({share:.0%} of their text)."
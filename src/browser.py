@@ -0,0 +1,194 @@
+import atexit
+import re
+import threading
+from collections import deque
+from typing import Callable
+
+RENDER_TIMEOUT_S = 20
+PAGES_PER_TAB = 25  # Long-lived tabs slowly leak memory, so they're swapped out periodically.
+POOL_SIZE = 2
+
+MIN_TEXT_CHARS = 300
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def _chrome_factory():
+    """Start a headless Chrome, ChromeDriverManager only resolves the driver once per process."""
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    from selenium.webdriver import Chrome
+
+    global _driver_path
+
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    return Chrome(service=Service(_driver_path), options=chrome_options)
+
+
+class BrowserPool:
+    """
+    A fixed number of long-lived browser instances shared by everything that renders pages.
+
+    Callers of `render` queue up for a free driver, so at most `size` pages are
+    rendered at the same time. Every page gets `timeout_s` to load before its driver
+    is thrown away and replaced, and a driver's tab is replaced by a fresh one
+    every `pages_per_tab` pages.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, driver_factory: Callable = _chrome_factory,
+                 timeout_s: float = RENDER_TIMEOUT_S, pages_per_tab: int = PAGES_PER_TAB) -> None:
+        self.size = size
+        self.timeout_s = timeout_s
+        self.pages_per_tab = pages_per_tab
+        self._driver_factory = driver_factory
+
+        self._idle = deque()
+        self._uses: dict[int, int] = {}
+        self._created = 0
+        # Guards `_idle` and `_created`. Waiters are woken whenever a driver is released or discarded,
+        # a discarded slot is theirs to fill with a fresh driver.
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()  # Until another render finishes.
+
+            if self._idle:
+                return self._idle.popleft()
+
+            self._created += 1
+
+        try:
+            driver = self._driver_factory()
+            driver.set_page_load_timeout(self.timeout_s)
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+        self._uses[id(driver)] = 0
+        return driver
+
+    def _release(self, driver) -> None:
+        self._uses[id(driver)] += 1
+
+        if self._uses[id(driver)] >= self.pages_per_tab:
+            try:
+                self._recycle_tab(driver)
+            except Exception:
+                self._discard(driver)
+                return
+
+            self._uses[id(driver)] = 0
+
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    def _recycle_tab(self, driver) -> None:
+        old_tab = driver.current_window_handle
+        driver.switch_to.new_window("tab")
+        new_tab = driver.current_window_handle
+
+        driver.switch_to.window(old_tab)
+        driver.close()
+        driver.switch_to.window(new_tab)
+
+    def _discard(self, driver) -> None:
+        self._uses.pop(id(driver), None)
+
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def render(self, url: str) -> str:
+        """Return the page source of `url` after the browser has rendered it."""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        driver = self._acquire()
+
+        try:
+            driver.get(url)
+
+            WebDriverWait(driver, self.timeout_s).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+
+            content = driver.page_source
+        except Exception:
+            # A driver that timed out may still be busy with the page, don't hand it out again.
+            self._discard(driver)
+            raise
+
+        self._release(driver)
+        return content
+
+    def close(self) -> None:
+        while True:
+            with self._cond:
+                if not self._idle:
+                    return
+                driver = self._idle.popleft()
+
+            self._discard(driver)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_browser_pool() -> BrowserPool:
+    """Process-wide pool, browsers are started on first use and quit at exit."""
+    global _default_pool
+
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool()
+            atexit.register(_default_pool.close)
+
+        return _default_pool
+
+
+_SCRIPT_STYLE = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>", re.I | re.S)
+_TAG = re.compile(r"<[^>]+>")
+_EMPTY_APP_ROOT = re.compile(r"<div[^>]+id=[\"']?(root|app|__next|__nuxt|___gatsby)[\"']?[^>]*>\s*</div>", re.I)
+_NEEDS_JS = re.compile(r"<noscript\b[^>]*>[^<]*(enable|requires?)\s+javascript", re.I)
+
+
+def looks_client_rendered(html: str | bytes) -> bool:
+    """
+    Cheap check whether a plain HTTP response is only the shell of a JavaScript app,
+    meaning the actual documentation only shows up after rendering in a browser.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+
+    if not html.strip():
+        return True
+
+    if _EMPTY_APP_ROOT.search(html) or _NEEDS_JS.search(html):
+        return True
+
+    # Barely any text but scripts that could fill it in.
+    text = _TAG.sub(" ", _SCRIPT_STYLE.sub(" ", html))
+    return len(" ".join(text.split())) < MIN_TEXT_CHARS and "<script" in html.lower()
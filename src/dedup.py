@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+from collections import Counter, defaultdict
+
+BITS = 64
+BANDS = 4  # 4 bands of 16 bits: fingerprints within 3 bits of each other share at least one band.
+MAX_DISTANCE = 3
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 16  # Below this SimHash is too noisy, such pages only match exact copies.
+
+_WORD = re.compile(r"\w+")
+_ENDPOINT = re.compile(r"(?<![A-Z])(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS)\s+(\S*/[^\s`'\"\\]*)")
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> tuple[int, int]:
+    """64-bit SimHash of the word 3-shingles of `text`, and the number of distinct shingles."""
+    words = _WORD.findall(text.lower())
+    shingles = Counter(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1)))
+
+    # Sum shingle weights per byte value for each of the 8 hash bytes, then per bit from
+    # those 8 * 256 totals, instead of looping over 64 bits for every shingle.
+    per_byte = [Counter() for _ in range(BITS // 8)]
+    for shingle, weight in shingles.items():
+        for i, byte in enumerate(_hash64(shingle).to_bytes(BITS // 8, "big")):
+            per_byte[i][byte] += weight
+
+    total = sum(shingles.values())
+    fingerprint = 0
+    for i, counts in enumerate(per_byte):
+        for bit in range(8):
+            ones = sum(weight for byte, weight in counts.items() if byte >> (7 - bit) & 1)
+            if 2 * ones > total:
+                fingerprint |= 1 << (BITS - 1 - (i * 8 + bit))
+
+    return fingerprint, len(shingles)
+
+
+def endpoint_signature(text: str) -> frozenset[str]:
+    """The 'METHOD /path' lines documented in `text`."""
+    return frozenset(f"{method} {path}" for method, path in _ENDPOINT.findall(text))
+
+
+class NearDuplicateIndex:
+    """
+    Incremental near-duplicate index over page texts.
+
+    Pages whose SimHash is within `max_distance` bits of an earlier page join that page's
+    cluster, the first page of a cluster stays its representative. Pages that document
+    different endpoints are never duplicates however alike their text, generated reference
+    pages (get-artist, get-show, ...) only differ in a few words. Candidates are found
+    through the fingerprint bands (LSH), so adding a page doesn't compare it to every
+    page seen before. Thread-safe.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE) -> None:
+        assert max_distance < BANDS, "bands have to outnumber the allowed distance to find every match"
+
+        self.max_distance = max_distance
+        self.clusters: dict[str, list[str]] = {}  # Representative -> duplicates dropped in its favour.
+
+        self._bands: dict[tuple[int, int], list[tuple[int, frozenset[str], str]]] = defaultdict(list)
+        self._exact: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _band_keys(fingerprint: int):
+        width = BITS // BANDS
+        return [(band, fingerprint >> (band * width) & ((1 << width) - 1)) for band in range(BANDS)]
+
+    def add(self, url: str, text: str) -> str | None:
+        """Register a page, returns the URL of the page it duplicates or None if it's new."""
+        normalized = " ".join(_WORD.findall(text.lower()))
+        signature = endpoint_signature(text)
+        exact_key = hashlib.blake2b("\n".join([normalized, *sorted(signature)]).encode("utf-8"),
+                                    digest_size=16).hexdigest()
+        fingerprint, shingles = simhash(normalized)
+        keys = self._band_keys(fingerprint)
+
+        with self._lock:
+            original = self._exact.get(exact_key)
+
+            if original is None and shingles >= MIN_SHINGLES:
+                candidates = (entry for key in keys for entry in self._bands[key])
+                original = next((other for other_fp, other_signature, other in candidates
+                                 if other_signature == signature
+                                 and (fingerprint ^ other_fp).bit_count() <= self.max_distance), None)
+
+            if original is not None:
+                self.clusters[original].append(url)
+                return original
+
+            self._exact[exact_key] = url
+            self.clusters[url] = []
+
+            if shingles >= MIN_SHINGLES:
+                for key in keys:
+                    self._bands[key].append((fingerprint, signature, url))
+
+        return None
+
+    @property
+    def dropped(self) -> int:
+        return sum(map(len, self.clusters.values()))
+
+    def report(self) -> str:
+        lines = [f"Near-duplicates: dropped {self.dropped} pages, kept {len(self.clusters)}."]
+        lines += [f"  {duplicate} -> {original}"
+                  for original, duplicates in self.clusters.items() for duplicate in duplicates]
+
+        return "\n".join(lines)
+
+
+def deduplicate(pages: dict[str, str], max_distance: int = MAX_DISTANCE) -> tuple[dict[str, str], NearDuplicateIndex]:
+    """Keep one page per near-duplicate cluster, in the original order."""
+    index = NearDuplicateIndex(max_distance)
+    kept = {url: text for url, text in pages.items() if index.add(url, text) is None}
+
+    return kept, index
@@ -0,0 +1,120 @@
+import gzip
+import io
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+from fetch import fetch, FetchError, USER_AGENT
+
+MAX_SITEMAPS = 50  # Sitemap indexes of big sites can list hundreds of files, most out of scope.
+
+
+@dataclass
+class Discovery:
+    """What a site tells crawlers about itself through robots.txt and its sitemaps."""
+    urls: dict[str, float | None] = field(default_factory=dict)  # In-scope page -> lastmod timestamp.
+    crawl_delay: float | None = None
+    robots: RobotFileParser | None = None
+    complete: bool = False  # Every sitemap found was read, `urls` has all the pages they list.
+
+    def allowed(self, url: str) -> bool:
+        return self.robots is None or self.robots.can_fetch(USER_AGENT, url)
+
+
+def _get(url: str) -> bytes | None:
+    try:
+        r = fetch(url)
+    except FetchError:
+        return None
+
+    if r.status_code != 200:
+        return None
+
+    if r.content[:2] != b"\x1f\x8b":
+        return r.content
+
+    # Sitemaps are often served as .xml.gz without a Content-Encoding header.
+    try:
+        return gzip.decompress(r.content)
+    except (OSError, EOFError):  # Truncated or not gzip after all.
+        return None
+
+
+def parse_lastmod(value: str | None) -> float | None:
+    """W3C datetime ('2024-05-01', '2024-05-01T10:00:00Z', ...) as a UTC timestamp."""
+    if not value:
+        return None
+
+    try:
+        moment = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return moment.timestamp()
+
+
+def parse_sitemap(data: bytes) -> tuple[dict[str, float | None], list[str]]:
+    """Pages (with lastmod) and nested sitemaps listed in a sitemap or sitemap index."""
+    pages, sitemaps = {}, []
+    loc = lastmod = None
+
+    try:
+        for _, element in ET.iterparse(io.BytesIO(data)):
+            tag = element.tag.rsplit("}", 1)[-1]  # Strip the sitemap namespace.
+
+            if tag == "loc":
+                loc = (element.text or "").strip()
+            elif tag == "lastmod":
+                lastmod = element.text
+            elif tag in ("url", "sitemap"):
+                if loc:
+                    if tag == "url":
+                        pages[loc] = parse_lastmod(lastmod)
+                    else:
+                        sitemaps.append(loc)
+                loc = lastmod = None
+                element.clear()
+    except ET.ParseError:
+        pass  # Keep whatever was read before the broken part.
+
+    return pages, sitemaps
+
+
+def discover(starting_url: str, base_url: str) -> Discovery:
+    """
+    Read robots.txt and the sitemaps it points to (or /sitemap.xml) and return every page
+    within `base_url` that robots.txt allows, along with the site's crawl delay. Sitemaps
+    past the first `MAX_SITEMAPS` aren't read, the discovery isn't `complete` then.
+    """
+    root = urljoin(starting_url, "/")
+    discovery = Discovery()
+
+    robots_txt = _get(urljoin(root, "robots.txt"))
+    if robots_txt is not None:
+        discovery.robots = RobotFileParser()
+        discovery.robots.parse(robots_txt.decode("utf-8", errors="replace").splitlines())
+        discovery.crawl_delay = discovery.robots.crawl_delay(USER_AGENT)
+
+    sitemaps = (discovery.robots and discovery.robots.site_maps()) or [urljoin(root, "sitemap.xml")]
+    queued, fetched = list(dict.fromkeys(sitemaps)), 0
+
+    while queued and fetched < MAX_SITEMAPS:
+        data = _get(queued.pop(0))
+        fetched += 1
+
+        if data is None:
+            continue
+
+        pages, nested = parse_sitemap(data)
+        queued.extend(s for s in nested if s not in queued)
+
+        discovery.urls.update({url: lastmod for url, lastmod in pages.items()
+                               if url.startswith(base_url) and discovery.allowed(url)})
+
+    discovery.complete = not queued
+    return discovery
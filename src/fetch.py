@@ -0,0 +1,130 @@
+import threading
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 8  # Keep-alive connections per host, should be >= the crawler's per-host limit.
+TIMEOUT_S = 30
+USER_AGENT = "aimaze-docs-crawler/0.1"
+
+
+class FetchError(Exception):
+    """Raised when a page couldn't be fetched at all (DNS, connection, timeout, ...)."""
+
+
+@dataclass
+class Response:
+    url: str
+    status_code: int
+    content: bytes
+    headers: dict[str, str] = field(default_factory=dict)  # Lowercased names.
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+def _accept_encoding() -> str:
+    # Only advertise brotli when a decoder is installed, otherwise the body can't be read.
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            return "gzip, deflate, br"
+        except ImportError:
+            pass
+
+    return "gzip, deflate"
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+class SessionPool:
+    """
+    Keeps one keep-alive session per host so repeated fetches from the same docs
+    site reuse their TCP/TLS connections instead of paying a handshake per page.
+
+    Uses httpx with HTTP/2 when `httpx` and `h2` are installed, requests otherwise.
+    Safe to share between threads.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, timeout_s: float = TIMEOUT_S, http2: bool = True) -> None:
+        self.pool_size = pool_size
+        self.timeout_s = timeout_s
+        self.http2 = http2 and _http2_available()
+        self.headers = {"User-Agent": USER_AGENT, "Accept-Encoding": _accept_encoding()}
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        if self.http2:
+            import httpx
+
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            return httpx.Client(http2=True, limits=limits, headers=self.headers,
+                                timeout=self.timeout_s, follow_redirects=True)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+
+        return session
+
+    def _session(self, url: str):
+        host = urlparse(url).netloc
+
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._new_session()
+
+            return self._sessions[host]
+
+    def get(self, url: str, headers: dict[str, str] | None = None) -> Response:
+        session = self._session(url)
+
+        try:
+            if self.http2:
+                r = session.get(url, headers=headers)
+            else:
+                r = session.get(url, headers=headers, timeout=self.timeout_s)
+        except Exception as e:  # Both libraries have their own exception trees.
+            raise FetchError(f"Couldn't fetch {url}: {e}") from e
+
+        return Response(str(r.url), r.status_code, r.content, {k.lower(): v for k, v in r.headers.items()})
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> SessionPool:
+    """Process-wide pool shared by the scrapers."""
+    global _default_pool
+
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+
+        return _default_pool
+
+
+def fetch(url: str, headers: dict[str, str] | None = None) -> Response:
+    return default_pool().get(url, headers)
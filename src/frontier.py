@@ -0,0 +1,106 @@
+import heapq
+import re
+from itertools import count
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that never change what a docs page shows, compared lowercased.
+IGNORED_PARAMS = {
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "fbclid", "gclid", "ref", "source",
+    "apiversion",  # GitHub serves the same page for every ?apiVersion=
+}
+
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+# Pages that probably describe endpoints are fetched first, pages that probably don't, last.
+ENDPOINT_HINTS = re.compile(r"(reference|endpoints?|/api/|/rest/|resources?|methods?|operations?|objects?)", re.I)
+LOW_VALUE_HINTS = re.compile(r"(changelog|release-notes|blog|/guides?/|tutorials?|community|pricing|login|sign-?up|"
+                             r"\.(png|jpe?g|gif|svg|pdf|zip|css|js)$)", re.I)
+
+
+def canonicalize(url: str, ignored_params: set[str] = IGNORED_PARAMS) -> str:
+    """
+    Normalize a URL so variants of the same page compare equal.
+
+    Lowercases scheme and host, drops default ports, fragments, duplicate and trailing
+    slashes, drops ignored query parameters and sorts the rest.
+    """
+    scheme, netloc, path, query, _ = urlsplit(url)
+    scheme, netloc = scheme.lower(), netloc.lower()
+
+    if netloc.endswith(DEFAULT_PORTS.get(scheme, "\0")):
+        netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+
+    path = re.sub(r"/{2,}", "/", path).rstrip("/") or "/"
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                    if k.lower() not in ignored_params)
+
+    return urlunsplit((scheme, netloc, path, urlencode(params), ""))
+
+
+def score(url: str, depth: int) -> float:
+    """Priority of a URL, lower is fetched sooner. Shallow pages and likely endpoint pages go first."""
+    path = urlsplit(url).path
+    priority = float(depth)
+
+    if ENDPOINT_HINTS.search(path):
+        priority -= 2
+    if LOW_VALUE_HINTS.search(path):
+        priority += 5
+
+    return priority
+
+
+class Frontier:
+    """
+    URLs waiting to be crawled, best first.
+
+    Every URL is deduplicated on its canonical form against everything that was ever
+    added, whether fetching it worked or not. URLs deeper than `max_depth` links from
+    the start are dropped, and after `max_pages` pops the frontier reports itself empty
+    so a big site can be cut off once its most important pages are in.
+    """
+
+    def __init__(self, max_depth: int | None = None, max_pages: int | None = None,
+                 ignored_params: set[str] = IGNORED_PARAMS) -> None:
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.ignored_params = ignored_params
+
+        self._heap: list[tuple[float, int, str, int]] = []
+        self._seen: set[str] = set()
+        self._order = count()  # Tie-breaker, equal scores come out in the order they were found.
+        self.popped = 0
+
+    def add(self, url: str, depth: int = 0) -> bool:
+        """Queue `url` if it's new and within the depth limit, returns whether it was queued."""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+
+        key = canonicalize(url, self.ignored_params)
+        if key in self._seen:
+            return False
+
+        self._seen.add(key)
+        heapq.heappush(self._heap, (score(url, depth), next(self._order), url, depth))
+
+        return True
+
+    def pop(self) -> tuple[str, int]:
+        """Best URL left and its depth."""
+        if not self:
+            raise IndexError("pop from an empty or exhausted frontier")
+
+        self.popped += 1
+        _, _, url, depth = heapq.heappop(self._heap)
+
+        return url, depth
+
+    def __len__(self) -> int:
+        if self.max_pages is not None:
+            return max(0, min(len(self._heap), self.max_pages - self.popped))
+
+        return len(self._heap)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
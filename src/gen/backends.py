@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+from gen.resilience import RETRY_STATUSES
+
+ANTHROPIC_MODEL = "claude-3-5-haiku-latest"
+ANTHROPIC_MAX_TOKENS = 8192
+
+
+@dataclass
+class Completion:
+    """A model's answer, the same for every backend."""
+    content: str
+    finish_reason: str  # "stop", or "length" when the output token limit cut it off.
+    total_tokens: int
+    headers: dict[str, str] = field(default_factory=dict)  # Rate limit headers, if the backend has any.
+
+
+class LLMBackend(ABC):
+    """
+    A chat model the generator can send prompts to.
+
+    `complete` takes OpenAI style messages and an optional OpenAI style `response_format`
+    (a json_schema or {"type": "json_object"}) and returns a `Completion`.
+    """
+    name: str
+    model: str
+
+    @abstractmethod
+    def complete(self, messages: list[dict], response_format: dict | None = None,
+                 temperature: float | None = None) -> Completion:
+        ...
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether `error` is worth another try (rate limits, server errors, dropped connections)."""
+        return getattr(error, "status_code", None) in RETRY_STATUSES
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model: str, api_key: str | None = None, base_url: str | None = None) -> None:
+        from openai import OpenAI
+
+        self.model = model
+        # Retries go through `with_backoff`, so they're visible to the rate limiter.
+        self.client = OpenAI(api_key=api_key or os.getenv("API_KEY"), base_url=base_url, max_retries=0)
+
+    def request(self, messages: list[dict], response_format: dict | None = None,
+                temperature: float | None = None) -> dict:
+        """Chat completion arguments, the same for a direct call and a batch request."""
+        request = {"messages": messages, "model": self.model}
+
+        if response_format is not None:
+            request["response_format"] = response_format
+        if temperature is not None:
+            request["temperature"] = temperature
+
+        return request
+
+    def complete(self, messages, response_format=None, temperature=None) -> Completion:
+        # Raw response so the rate limit headers can be fed back into the limiter.
+        raw = self.client.chat.completions.with_raw_response.create(
+            **self.request(messages, response_format, temperature))
+        chat_completion = raw.parse()
+        choice = chat_completion.choices[0]
+
+        return Completion(choice.message.content or "", choice.finish_reason,
+                          chat_completion.usage.total_tokens, dict(raw.headers))
+
+    def is_retryable(self, error):
+        from openai import APIConnectionError
+
+        return super().is_retryable(error) or isinstance(error, APIConnectionError)
+
+
+class AnthropicBackend(LLMBackend):
+    """
+    Claude through the Anthropic API. Structured output is done with a forced tool call
+    whose input schema is the requested JSON schema.
+    """
+    name = "anthropic"
+
+    def __init__(self, model: str = ANTHROPIC_MODEL, api_key: str | None = None,
+                 max_tokens: int = ANTHROPIC_MAX_TOKENS) -> None:
+        from anthropic import Anthropic
+
+        self.model = model
+        self.max_tokens = max_tokens
+        self.client = Anthropic(api_key=api_key or os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+
+    def complete(self, messages, response_format=None, temperature=None) -> Completion:
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        request = {"model": self.model, "max_tokens": self.max_tokens,
+                   "messages": [m for m in messages if m["role"] != "system"]}
+
+        if system:
+            request["system"] = system
+        if temperature is not None:
+            request["temperature"] = temperature
+
+        tool = None
+        if response_format is not None:
+            if response_format["type"] == "json_schema":
+                spec = response_format["json_schema"]
+                tool = {"name": spec["name"], "input_schema": spec["schema"]}
+            else:
+                tool = {"name": "answer", "input_schema": {"type": "object", "additionalProperties": True}}
+
+            request["tools"] = [tool]
+            request["tool_choice"] = {"type": "tool", "name": tool["name"]}
+
+        raw = self.client.messages.with_raw_response.create(**request)
+        message = raw.parse()
+
+        if tool is not None:
+            content = next((json.dumps(block.input) for block in message.content if block.type == "tool_use"), "")
+        else:
+            content = "".join(block.text for block in message.content if block.type == "text")
+
+        return Completion(content, "length" if message.stop_reason == "max_tokens" else "stop",
+                          message.usage.input_tokens + message.usage.output_tokens, dict(raw.headers))
+
+    def is_retryable(self, error):
+        from anthropic import APIConnectionError
+
+        return (super().is_retryable(error) or getattr(error, "status_code", None) == 529  # Overloaded.
+                or isinstance(error, APIConnectionError))
+
+
+class StubRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after_s: float) -> None:
+        super().__init__(f"Stub rate limit, retry after {retry_after_s:.2f}s")
+        self.response = SimpleNamespace(headers={"retry-after-ms": str(int(retry_after_s * 1000))})
+
+
+def _request_key(messages: list[dict], response_format: dict | None) -> str:
+    return hashlib.sha256(json.dumps([messages, response_format], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+_ENDPOINT = re.compile(r"(?<![A-Z])(GET|POST|PUT|PATCH|DELETE)\s+(/[^\s`'\"\\]*)")
+
+
+def stub_answer(messages: list[dict], response_format: dict | None) -> str:
+    """
+    A cheap, deterministic answer of the right shape: one endpoint per 'METHOD /path' in
+    the prompt, no general info, and the last line as the split line.
+    """
+    prompt = messages[-1]["content"]
+    name = (response_format or {}).get("json_schema", {}).get("name")
+
+    if name == "endpoints":
+        found = dict.fromkeys(_ENDPOINT.findall(prompt))
+        return json.dumps({
+            "endpoints": [{"name": f"{method.lower()} {path}", "url": path, "args_in_url": False, "method": method,
+                           "input_parameters": [], "output_parameters": [], "description": f"{method} {path}"}
+                          for method, path in found],
+            "general_info": [],
+        })
+
+    if name == "general_info":
+        return json.dumps({"general_info": []})
+
+    numbers = re.findall(r"^(\d+): ", prompt, re.M)
+    return json.dumps({"split_line": int(numbers[-1]) if numbers else 1})
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend for load tests of the concurrency, batching and rate limiting code.
+
+    Answers come from `replay` (a file written by `RecordingBackend`) when it has the exact
+    request, otherwise from `answer(messages, response_format)`. Every call sleeps
+    `latency_s` (plus up to `jitter_s`, seeded, so runs repeat) and reports the prompt's
+    characters / `chars_per_token` + `output_tokens` as its usage. With `tpm_limit` it
+    also keeps its own token window, sends x-ratelimit headers like OpenAI and raises a
+    429 once the window is full.
+    """
+    name = "stub"
+
+    def __init__(self, model: str = "stub", latency_s: float = 0.0, jitter_s: float = 0.0,
+                 chars_per_token: float = 4.0, output_tokens: int = 500, tpm_limit: int | None = None,
+                 replay: str | None = None, answer=stub_answer, seed: int = 0) -> None:
+        self.model = model
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.chars_per_token = chars_per_token
+        self.output_tokens = output_tokens
+        self.tpm_limit = tpm_limit
+        self.answer = answer
+
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._window: deque[tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+        self._replay: dict[str, dict] = {}
+        if replay and os.path.exists(replay):
+            with open(replay, encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._replay[record["key"]] = record
+
+    def _charge(self, tokens: int) -> tuple[dict[str, str], float]:
+        now = time.time()
+
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_s + self._random.uniform(0, self.jitter_s)
+
+            if self.tpm_limit is None:
+                return {}, delay
+
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+
+            used = sum(t for _, t in self._window)
+            if used + tokens > self.tpm_limit and self._window:
+                raise StubRateLimitError(self._window[0][0] + 60 - now)
+
+            self._window.append((now, tokens))
+            return {"x-ratelimit-limit-tokens": str(self.tpm_limit),
+                    "x-ratelimit-remaining-tokens": str(max(self.tpm_limit - used - tokens, 0)),
+                    "x-ratelimit-reset-tokens": f"{max(60 - (now - self._window[0][0]), 0):.3f}s"}, delay
+
+    def complete(self, messages, response_format=None, temperature=None) -> Completion:
+        tokens = int(sum(len(m["content"]) for m in messages) / self.chars_per_token) + self.output_tokens
+        headers, delay = self._charge(tokens)
+        time.sleep(delay)
+
+        recorded = self._replay.get(_request_key(messages, response_format))
+        if recorded is not None:
+            return Completion(recorded["content"], recorded["finish_reason"], recorded["total_tokens"], headers)
+
+        return Completion(self.answer(messages, response_format), "stop", tokens, headers)
+
+
+class RecordingBackend(LLMBackend):
+    """Passes calls on to `inner` and appends every answer to `path`, for `StubBackend(replay=path)`."""
+
+    def __init__(self, inner: LLMBackend, path: str) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.model = inner.model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def complete(self, messages, response_format=None, temperature=None) -> Completion:
+        completion = self.inner.complete(messages, response_format, temperature)
+
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": _request_key(messages, response_format), "content": completion.content,
+                                "finish_reason": completion.finish_reason,
+                                "total_tokens": completion.total_tokens}) + "\n")
+
+        return completion
+
+    def is_retryable(self, error):
+        return self.inner.is_retryable(error)
+
+
+def backend_from_env(openai_model: str) -> LLMBackend:
+    """
+    The backend picked by the LLM_BACKEND environment variable: 'openai' (default),
+    'anthropic' (model from ANTHROPIC_MODEL) or 'stub' (latency from STUB_LATENCY_S,
+    answers replayed from STUB_REPLAY if set).
+    """
+    match os.getenv("LLM_BACKEND", "openai").lower():
+        case "anthropic":
+            return AnthropicBackend(os.getenv("ANTHROPIC_MODEL", ANTHROPIC_MODEL))
+        case "stub":
+            return StubBackend(latency_s=float(os.getenv("STUB_LATENCY_S", "0")), replay=os.getenv("STUB_REPLAY"))
+        case _:
+            return OpenAIBackend(openai_model, base_url=os.getenv("OPENAI_BASE_URL"))
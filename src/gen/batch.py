@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+from gen.store import content_hash
+
+BATCH_DIR = ".cache/batches"
+ENDPOINT = "/v1/chat/completions"
+POLL_S = 30
+FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_requests(bodies: dict[str, dict], root: str = BATCH_DIR) -> str:
+    """Write one batch request line per body, keyed by its custom id. Returns the file's path."""
+    lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body})
+             for custom_id, body in bodies.items()]
+
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, f"{content_hash(*lines)[:16]}.jsonl")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return path
+
+
+def submit(client, bodies: dict[str, dict], completion_window: str = "24h") -> str:
+    """Upload the requests and start a batch on them, returns the batch id."""
+    path = write_requests(bodies)
+
+    with open(path, "rb") as f:
+        upload = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(input_file_id=upload.id, endpoint=ENDPOINT, completion_window=completion_window)
+    print(f"Submitted batch {batch.id} with {len(bodies)} requests.")
+
+    return batch.id
+
+
+def wait(client, batch_id: str, poll_s: float = POLL_S):
+    """Poll the batch until it's done one way or another."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+
+        if batch.status in FINAL_STATES:
+            return batch
+
+        counts = batch.request_counts
+        done = f"{counts.completed + counts.failed}/{counts.total}" if counts else "?"
+        print(f"Batch {batch_id} {batch.status}, {done} requests done.          ", end="\r")
+        time.sleep(poll_s)
+
+
+def results(client, batch) -> dict[str, dict]:
+    """Response bodies of a finished batch by custom id. Requests that failed are left out."""
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"Batch {batch.id} ended as {batch.status}.")
+
+    bodies = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            response = record.get("response") or {}
+
+            if response.get("status_code") == 200:
+                bodies[record["custom_id"]] = response["body"]
+
+    return bodies
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the OpenAI file and batch endpoints, to try batch mode without an account.
+
+    python src/gen/batch_stub.py [port]
+    OPENAI_BASE_URL=http://localhost:8900/v1 python src/main.py --batch
+
+Every request in a batch is answered by `responder(body)`, which by default returns an
+empty extraction. Batches finish `delay_s` seconds after they're created.
+"""
+import email.parser
+import email.policy
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8900
+
+
+def empty_extraction(body: dict) -> str:
+    return json.dumps({"endpoints": [], "general_info": []})
+
+
+def _completion(body: dict, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class BatchStub:
+    def __init__(self, responder=empty_extraction, delay_s: float = 0.0) -> None:
+        self.responder = responder
+        self.delay_s = delay_s
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, batch: dict) -> None:
+        """Answer every request of the batch and store the output file."""
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if line.strip():
+                request = json.loads(line)
+                lines.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                 "body": _completion(request["body"], self.responder(request["body"]))},
+                    "error": None,
+                }))
+
+        output_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+        batch.update(status="completed", output_file_id=output_id, completed_at=int(time.time()),
+                     request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    def batch(self, batch_id: str) -> dict | None:
+        with self._lock:
+            batch = self.batches.get(batch_id)
+
+            if batch and batch["status"] == "in_progress" and time.time() >= batch["created_at"] + self.delay_s:
+                self._run(batch)
+
+            return batch
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, payload: dict | bytes) -> None:
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream" if isinstance(payload, bytes)
+                                 else "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                if self.path == "/v1/files":
+                    # Multipart upload, let the email parser pull the file out.
+                    head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+                    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + self._body())
+                    part = next(p for p in message.iter_parts() if p.get_param("name", header="content-disposition") == "file")
+
+                    file_id = f"file-{uuid.uuid4().hex[:12]}"
+                    stub.files[file_id] = part.get_payload(decode=True)
+                    return self._send(200, {"id": file_id, "object": "file", "purpose": "batch",
+                                            "bytes": len(stub.files[file_id]), "created_at": int(time.time()),
+                                            "filename": part.get_filename() or "batch.jsonl", "status": "processed"})
+
+                if self.path == "/v1/batches":
+                    request = json.loads(self._body())
+                    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+                    batch = {"id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                             "input_file_id": request["input_file_id"], "status": "in_progress",
+                             "completion_window": request["completion_window"], "created_at": int(time.time()),
+                             "output_file_id": None, "error_file_id": None, "request_counts": None}
+                    with stub._lock:
+                        stub.batches[batch_id] = batch
+                    return self._send(200, stub.batch(batch_id))
+
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+
+                if parts[:2] == ["v1", "batches"] and len(parts) == 3 and (batch := stub.batch(parts[2])):
+                    return self._send(200, batch)
+
+                if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in stub.files:
+                    return self._send(200, stub.files[parts[2]])
+
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def serve(port: int = DEFAULT_PORT, responder=empty_extraction, delay_s: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub in a background thread, call `shutdown()` on the returned server to stop it."""
+    server = ThreadingHTTPServer(("localhost", port), BatchStub(responder, delay_s).handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    serve(port, delay_s=5)
+    print(f"Batch stub listening on http://localhost:{port}/v1")
+    threading.Event().wait()
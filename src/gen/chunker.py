@@ -1,16 +1,18 @@
 from markdownify import markdownify
 import json
+import re
 
-from openai import OpenAI
 import tiktoken
 from tqdm import tqdm
 
-DEFAULT_NEIGHBOURHOOD_TOKENS = 5000
-
+from gen.token_index import TokenIndex
+from gen.backends import LLMBackend
+from gen.limit_utils import SlidingWindowRateLimiter
+from gen.resilience import limited_complete
 
-def _count_tokens(encoder: tiktoken.Encoding, text: str) -> int:
-    """Return the number of tokens `text` would occupy for the chosen model."""
-    return len(encoder.encode(text))
+DEFAULT_NEIGHBOURHOOD_TOKENS = 5000
+SPLIT_OUTPUT_TOKENS = 50  # {"split_line": <int>}, reserved on top of the prompt.
+ENCODER = tiktoken.encoding_for_model("gpt-4o")
 
 
 def enumerate_lines(text: str) -> str:
@@ -47,25 +49,30 @@ def _build_split_messages(numbered_chunk: str) -> list[dict[str, str]]:
     ]
 
 
-def _openai_split_call(client: OpenAI, model_name: str, numbered_chunk: str) -> int:
-    """Query the model for a safe split line and return it as an integer."""
-    res = client.chat.completions.create(
-        model=model_name,
-        messages=_build_split_messages(numbered_chunk),
-        response_format={"type": "json_object"},
-        temperature=0,
-    )
-    return int(json.loads(res.choices[0].message.content)["split_line"])
+def _split_call(backend: LLMBackend, limiter: SlidingWindowRateLimiter | None, numbered_chunk: str) -> int | None:
+    """Query the model for a safe split line, None if the answer has no usable line number."""
+    messages = _build_split_messages(numbered_chunk)
+    tokens = sum(len(ENCODER.encode(m["content"])) for m in messages) + SPLIT_OUTPUT_TOKENS
 
+    res = limited_complete(backend, limiter, messages, tokens, response_format={"type": "json_object"},
+                           temperature=0)
 
-def chunk_page(
-    client: OpenAI,
-    model_name: str,
-    page_md: str,
+    try:
+        return int(json.loads(res.content)["split_line"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _llm_chunk_lines(
+    backend: LLMBackend,
+    limiter: SlidingWindowRateLimiter | None,
+    index: TokenIndex,
+    start: int,
+    end: int,
     chunk_tokens: int,
     context_tokens: int = DEFAULT_NEIGHBOURHOOD_TOKENS,
-) -> list[str]:
-    """Split a Markdown API page into a list of complete‑endpoint chunks.
+) -> list[tuple[int, int]]:
+    """Split lines[start:end] the structural chunker couldn't decide on by asking the model for split lines.
 
     Windowing strategy (token‑based):
       - Build a *hard* window starting at `cursor` so that its token budget is
@@ -75,85 +82,202 @@ def chunk_page(
         context for the LLM – they are **not** included in the final chunk.
       - Ask the LLM for the last line that leaves every endpoint above it
         complete (relative to the numbered block).
-      - Cut from `cursor` up to the suggested line and repeat until EOF.
+      - Cut from `cursor` up to the suggested line and repeat until `end`. An answer
+        outside the window, or none at all, cuts the hard window in the middle.
+
+    Window edges come from the page's token index, only the prompts are encoded to reserve
+    their tokens with `limiter`.
     """
-    encoder = tiktoken.encoding_for_model("gpt-4o")
     chunk_tokens -= context_tokens  # So we're sure not to include and go over actual context window.
 
-    raw_lines = page_md.splitlines()
-    total_lines = len(raw_lines)
-    # print("Starting chunk_page: total_lines={}", total_lines)
-
-    chunks: list[str] = []
-    cursor = 0  # first unprocessed line index
-
-    pbar = tqdm(total=total_lines, unit=" line")
-
-    while cursor < total_lines:
-        # Build forward window
-        token_fw = 0
-        hard_end = cursor
-        while hard_end < total_lines and token_fw < chunk_tokens:
-            token_fw += _count_tokens(encoder, raw_lines[hard_end])
-            hard_end += 1
-        # print(f"Hard window: cursor={cursor} -> hard_end={hard_end} ({token_fw} tokens)")
-
-        # EOF reached inside hard window → dump rest
-        if hard_end >= total_lines:
-            # print("EOF hit inside hard window; emitting final chunk")
-            consumed = total_lines - cursor
-            pbar.update(consumed)
-            chunks.append("\n".join(raw_lines[cursor:]))
-            break
+    spans: list[tuple[int, int]] = []
+    cursor = start  # first unprocessed line index
 
-        # Build backward context
-        token_bw = 0
-        back_start = hard_end
-        while back_start > 0 and token_bw < context_tokens:
-            back_start -= 1
-            token_bw += _count_tokens(encoder, raw_lines[back_start])
-
-        # Build forward context
-        token_ctx_fw = 0
-        soft_end = hard_end
-        while soft_end < total_lines and token_ctx_fw < context_tokens:
-            token_ctx_fw += _count_tokens(encoder, raw_lines[soft_end])
-            soft_end += 1
-        # print(f"Context: back_start={back_start} soft_end={soft_end}")
-
-        # Forward context hits EOF → dump rest
-        if soft_end >= total_lines:
-            # print("EOF hit while filling forward context; emitting final chunk")
-            consumed = total_lines - cursor
-            pbar.update(consumed)
-            chunks.append("\n".join(raw_lines[cursor:]))
+    pbar = tqdm(total=end - start, unit=" line")
+
+    while cursor < end:
+        # Hard window, then context on both sides of its end.
+        hard_end = min(index.forward(cursor, chunk_tokens), end)
+        back_start = max(index.backward(hard_end, context_tokens), start)
+        soft_end = min(index.forward(hard_end, context_tokens), end)
+
+        # EOF reached inside the hard window or its forward context → dump rest
+        if hard_end >= end or soft_end >= end:
+            pbar.update(end - cursor)
+            spans.append((cursor, end))
             break
 
         # Query model for split point
-        numbered_block = enumerate_lines("\n".join(raw_lines[back_start:soft_end]))
-        split_line_local = _openai_split_call(client, model_name, numbered_block)
-        split_line_global = back_start + split_line_local
-        assert cursor < split_line_global <= soft_end, "Invalid split line returned"
-        # print(f"Accepted split_line_global={split_line_global}")
+        numbered_block = enumerate_lines("\n".join(index.lines[back_start:soft_end]))
+        split_line_local = _split_call(backend, limiter, numbered_block)
+        split_line_global = back_start + split_line_local if split_line_local is not None else None
+
+        if split_line_global is None or not cursor < split_line_global <= soft_end:
+            split_line_global = max((cursor + hard_end) // 2, cursor + 1)
 
-        consumed = split_line_global - cursor
-        pbar.update(consumed)
+        pbar.update(split_line_global - cursor)
 
         # Emit chunk and advance cursor
-        chunks.append("\n".join(raw_lines[cursor:split_line_global]))
+        spans.append((cursor, split_line_global))
         cursor = split_line_global
 
-    # print(f"chunk_page finished: {len(chunks)} chunks produced")
     pbar.close()
-    return chunks
+    return spans
+
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_ATX_HEADING = re.compile(r"^(#{1,6})\s")
+_SETEXT_UNDERLINE = re.compile(r"^\s*(=+|-+)\s*$")
+_ENDPOINT_LINE = re.compile(r"^\W{0,4}(GET|POST|PUT|PATCH|DELETE|HEAD|OPTIONS)\W{0,4}\s+\S*/")
+_TABLE_ROW = re.compile(r"^\s*\|")
+
+ENDPOINT_LEVEL = 7  # Endpoint lines without a heading right above them rank below h6.
+PARAGRAPH_LEVEL = 8  # Blank lines outside code blocks and tables.
+BLOCK_LEVEL = 9  # Any other line that isn't inside a code block or table.
+HEADING_LOOKBACK = 3  # Non-blank lines an endpoint line may sit below its heading.
+
+
+def _boundaries(lines: list[str]) -> list[int]:
+    """
+    Rank every line by how good a place it is to start a new chunk, lower is better.
+
+    Lines inside fenced code blocks and tables (and setext heading underlines) get
+    no rank at all, so chunks are never cut through them.
+    """
+    ranks = [BLOCK_LEVEL] * len(lines)
+    in_fence = False
+    since_heading = HEADING_LOOKBACK + 1
+
+    for i, line in enumerate(lines):
+        if _FENCE.match(line):
+            if in_fence:
+                ranks[i] = None  # The closing fence belongs to the block above.
+            in_fence = not in_fence
+            continue
+
+        if in_fence:
+            ranks[i] = None
+            continue
+
+        if not line.strip():
+            ranks[i] = PARAGRAPH_LEVEL
+            continue
+
+        if _TABLE_ROW.match(line) and i and lines[i - 1].strip() and _TABLE_ROW.match(lines[i - 1]):
+            ranks[i] = None
+            continue
+
+        if (i and _SETEXT_UNDERLINE.match(line) and lines[i - 1].strip()
+                and ranks[i - 1] is not None and not _TABLE_ROW.match(lines[i - 1])):
+            # markdownify writes h1/h2 underlined, the heading starts on the line above.
+            ranks[i - 1] = 1 if line.strip()[0] == "=" else 2
+            ranks[i] = None
+            since_heading = 0
+            continue
+
+        if heading := _ATX_HEADING.match(line):
+            ranks[i] = len(heading.group(1))
+            since_heading = 0
+            continue
+
+        since_heading += 1
+
+        if _ENDPOINT_LINE.match(line) and since_heading > HEADING_LOOKBACK:
+            ranks[i] = ENDPOINT_LEVEL
+
+    return ranks
+
+
+def chunk_spans(
+    index: TokenIndex,
+    chunk_tokens: int,
+    backend: LLMBackend | None = None,
+    context_tokens: int = DEFAULT_NEIGHBOURHOOD_TOKENS,
+    limiter: SlidingWindowRateLimiter | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Line ranges (start, end) of the chunks `chunk_page` would cut the indexed page into.
+    Calls to `backend` go through `limiter`, the one the extraction calls share.
+    """
+    lines = index.lines
+    ranks = _boundaries(lines)
+
+    def undecidable(start: int, end: int) -> list[tuple[int, int]]:
+        if backend is not None:
+            return _llm_chunk_lines(backend, limiter, index, start, end, chunk_tokens, context_tokens)
+
+        spans, cursor = [], start
+        while cursor < end:
+            cut = min(max(index.fitting(cursor, chunk_tokens), cursor + 1), end)  # At least one line per chunk.
+            spans.append((cursor, cut))
+            cursor = cut
+        return spans
+
+    def split(start: int, end: int, level: int) -> list[tuple[int, int]]:
+        if index.tokens(start, end) <= chunk_tokens:
+            return [(start, end)]
+
+        # Try the strongest boundary present in this span first.
+        while level <= BLOCK_LEVEL:
+            cuts = [i for i in range(start + 1, end) if ranks[i] is not None and ranks[i] <= level]
+            if cuts:
+                break
+            level += 1
+        else:
+            return undecidable(start, end)
+
+        pieces = []
+        for piece_start, piece_end in zip([start] + cuts, cuts + [end]):
+            pieces.extend(split(piece_start, piece_end, level + 1))
+
+        # Greedily merge neighbours back together, so chunks end up as full as possible.
+        merged = [pieces[0]]
+        for piece_start, piece_end in pieces[1:]:
+            if index.tokens(merged[-1][0], piece_end) <= chunk_tokens:
+                merged[-1] = (merged[-1][0], piece_end)
+            else:
+                merged.append((piece_start, piece_end))
+
+        return merged
+
+    if not lines:
+        return []
+
+    return split(0, len(lines), 1)
+
+
+def chunk_page(
+    page_md: str,
+    chunk_tokens: int,
+    backend: LLMBackend | None = None,
+    context_tokens: int = DEFAULT_NEIGHBOURHOOD_TOKENS,
+    index: TokenIndex | None = None,
+    limiter: SlidingWindowRateLimiter | None = None,
+) -> list[str]:
+    """Split a Markdown API page into a list of complete‑endpoint chunks of at most `chunk_tokens`.
+
+    The page is cut along its own structure: first at the highest-level headings, and
+    any section that's still too big at the next level down (lower headings, HTTP
+    method/URL lines, paragraphs). Adjacent pieces are then merged back together as
+    long as they fit. Code blocks and tables are never cut.
+
+    Only when a single block is bigger than the budget is the model asked for a split
+    line (if a `backend` is given), otherwise such a block is cut between lines.
+    Pass the page's `index` when it's already been built to skip encoding it again, and
+    the `limiter` the other calls to the backend go through.
+    """
+    if index is None:
+        index = TokenIndex(page_md, ENCODER)
 
+    return ["\n".join(index.lines[start:end])
+            for start, end in chunk_spans(index, chunk_tokens, backend, context_tokens, limiter)]
 
 
 if __name__ == "__main__":
     with open("./source_html/woocommerce.html", encoding="utf-8") as f:
         html = f.read()
         md_content = markdownify(html)
-    pieces = chunk_page(md_content)
+    pieces = chunk_page(md_content, 10_000)
     print(f"Created {len(pieces)}")
 
 
@@ -0,0 +1,107 @@
+"""
+Black formatting of generated files, spread over processes and cached on disk.
+
+Benchmark on the last extraction:
+
+    python src/gen/formatting.py [tmp.json]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import black
+
+if __name__ == "__main__":
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # src/, not src/gen/.
+
+from gen.store import content_hash
+
+FORMAT_CACHE_DIR = ".cache/black"
+SERIAL_BELOW = 8  # Fewer files than this aren't worth starting processes for.
+
+
+def _format(code: str) -> str:
+    return black.format_str(code, mode=black.FileMode())
+
+
+def _cache_path(code: str, root: str) -> str:
+    # Another black version may format differently, so it's part of the key.
+    return os.path.join(root, f"{content_hash(black.__version__, code)[:32]}.py")
+
+
+def _pool(workers: int) -> ProcessPoolExecutor | None:
+    # Spawned workers re-import the main module, and main.py runs its CLI at import. Only fork is safe.
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+
+
+def format_files(scripts: dict[str, str], root: str = FORMAT_CACHE_DIR) -> dict[str, str]:
+    """
+    Black every file in `scripts` (filename: code). Files formatted before, with the same
+    source and black version, come from the cache in `root`, the rest is formatted in a
+    process pool.
+    """
+    os.makedirs(root, exist_ok=True)
+    formatted, todo = {}, {}
+
+    for filename, code in scripts.items():
+        try:
+            with open(_cache_path(code, root), encoding="utf-8") as f:
+                formatted[filename] = f.read()
+        except FileNotFoundError:
+            todo[filename] = code
+
+    workers = os.cpu_count() or 1
+    pool = _pool(workers) if len(todo) >= SERIAL_BELOW and workers > 1 else None
+
+    if pool is None:
+        done = map(_format, todo.values())
+    else:
+        with pool:
+            done = list(pool.map(_format, todo.values(), chunksize=max(len(todo) // (4 * workers), 1)))
+
+    for (filename, code), result in zip(todo.items(), done):
+        formatted[filename] = result
+
+        with open(_cache_path(code, root), "w", encoding="utf-8") as f:
+            f.write(result)
+
+    return {filename: formatted[filename] for filename in scripts}
+
+
+if __name__ == "__main__":
+    import json
+    from gen.transpiler import wrap_api
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else "tmp.json") as f:
+        schema = json.load(f)
+
+    scripts = wrap_api(schema, "https://api.example.com", "example", formatted=False)
+    root = os.path.join(FORMAT_CACHE_DIR, "benchmark")
+    shutil.rmtree(root, ignore_errors=True)
+
+    start = time.perf_counter()
+    serial = {filename: _format(code) for filename, code in scripts.items()}
+    print(f"Serial:     {time.perf_counter() - start:6.2f}s for {len(scripts)} files")
+
+    start = time.perf_counter()
+    cold = format_files(scripts, root)
+    print(f"Pool, cold: {time.perf_counter() - start:6.2f}s ({os.cpu_count()} processes)")
+
+    start = time.perf_counter()
+    warm = format_files(scripts, root)
+    print(f"Cached:     {time.perf_counter() - start:6.2f}s")
+
+    changed = dict(scripts)
+    changed[next(iter(changed))] += "\n\nEXTRA  =  1\n"
+    start = time.perf_counter()
+    format_files(changed, root)
+    print(f"One change: {time.perf_counter() - start:6.2f}s")
+
+    assert serial == cold == warm
+    shutil.rmtree(root)
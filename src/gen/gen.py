@@ -1,19 +1,26 @@
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import BoundedSemaphore
+from typing import Iterable
 from pprint import pprint
 from urllib.parse import urljoin
-from openai import OpenAI
 from math import ceil
 
 import json
 from gen.transpiler import wrap_api
-from gen.chunker import chunk_page
-
-from copy import deepcopy
+from gen.chunker import chunk_spans
+from gen.token_index import TokenIndex
+from gen.planner import plan_calls, OnlinePacker
 
 from schemas import OPENAI_SCHEMA_FILTER, OPENAI_SCHEMA_PARSE
 import tiktoken
 
 from gen.limit_utils import SlidingWindowRateLimiter
+from gen.store import ExtractionStore, content_hash
+from gen.journal import RunJournal
+from gen.resilience import limited_complete, salvage_json
+from gen import batch as batches
+from gen.backends import LLMBackend, OpenAIBackend, backend_from_env
+from gen.merge import premerge, batch_groups, EndpointIndex
 
 MODEL = "gpt-4.1-nano"
 # MODEL = "gpt-4o-2024-08-06"
@@ -22,7 +29,14 @@ ENCODER = tiktoken.encoding_for_model("gpt-4o")
 # https://platform.openai.com/settings/organization/limits
 TPM_LIMIT = 200000 # 4.1-nane
 # TPM_LIMIT = 30000 # 4o
-tpm_limiter = SlidingWindowRateLimiter(tpm_limit=TPM_LIMIT)
+RPM_LIMIT = 500
+tpm_limiter = SlidingWindowRateLimiter(tpm_limit=TPM_LIMIT, rpm_limit=RPM_LIMIT)
+
+EXTRACTION_WORKERS = 8  # Extraction calls in flight at once, the limiter keeps them under the TPM budget.
+EXPECTED_OUTPUT_TOKENS = 4000  # Reserved per call until the actual usage is known.
+GROUP_BY_PREFIX = True  # Prefer packing pages from the same URL 'directory' into one call.
+MAX_SPLIT_DEPTH = 4  # How often a call whose output got cut off is halved and sent again.
+MERGE_BATCH_TOKENS = 6000  # General info conflicts per model call, keeps the merge far under the context size.
 
  
 # Explain general_info in schema for auth more in prompt.
@@ -36,7 +50,7 @@ Here is the page you need to parse:
 """
 
 GEN_INFO_FILTER_PROMPT = """
-You are part of an agentic system that extracts API information from their documentation. The end result is transpiled into python for developers to easily access the API. At the previous step an LLM extracted endpoint information and general information for each chunk in the documenation. These calls were separate from each other so the general info section likely contains duplicate fields. Please analyze the inferred general info from these calls and return a single dictionary containing only 1 instance of each unique item. For the explanation fields of duplicate items: inspect all explanations for the field and create a new description can encapsulates all insights.
+You are part of an agentic system that extracts API information from their documentation. The end result is transpiled into python for developers to easily access the API. At the previous step an LLM extracted endpoint information and general information for each chunk in the documenation. These calls were separate from each other so the general info section contains duplicate fields. Below is a list of groups, each group holds variants of what looks like the same variable that disagree on their type or default value, or whose names are only alike. Return a single item for every group that is one variable, with the type and default that fit the API best, and a separate item for each variable in a group that turns out to hold different ones. For the explanation fields: inspect all explanations for the field and create a new description can encapsulates all insights.
 
 Do this only for variables you encounter that make sense within a singleton config for the API code. For instance, API keys should be kept, but request specific id's shouldn't (that should be in the endpoint specific code).
 
@@ -47,118 +61,404 @@ Here are the general info instances:
 ```
 """
 
-CONTEXT_SIZE = 28_000 - len(ENCODER.encode(SCHEMA_EXTRACTION_PROMPT))
+PROMPT_TOKENS = len(ENCODER.encode(SCHEMA_EXTRACTION_PROMPT))
+CONTEXT_SIZE = 28_000 - PROMPT_TOKENS
 
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("API_KEY"))
+_backend: LLMBackend | None = None
 
 # After loop prints on same lines these so we wipe longer text previously on line.
 CLEARLINE = "                      "
 
-def _filter_gen_info(info: list[dict]) -> dict:
-    chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": GEN_INFO_FILTER_PROMPT.format(infos=str(info))
-                }
-            ],
-            model=MODEL,
-            response_format=OPENAI_SCHEMA_FILTER
-        )
-
-    try:
-        merged = json.loads(chat_completion.choices[0].message.content)["general_info"]
-    except: 
+
+class ExtractionError(Exception):
+    """The model answered something that isn't the JSON we asked for."""
+
+
+def get_backend() -> LLMBackend:
+    """The model backend, created on first use from the environment (see `backend_from_env`)."""
+    global _backend
+
+    if _backend is None:
+        _backend = backend_from_env(MODEL)
+
+    return _backend
+
+
+def set_backend(backend: LLMBackend) -> None:
+    """Use `backend` for everything from here on, e.g. a `StubBackend` for offline load tests."""
+    global _backend
+    _backend = backend
+
+
+def _store() -> ExtractionStore:
+    # Anything that changes what the model would answer, stored results are only reused when all of it matches.
+    return ExtractionStore(content_hash(get_backend().model, SCHEMA_EXTRACTION_PROMPT,
+                                        json.dumps(OPENAI_SCHEMA_PARSE, sort_keys=True)))
+
+
+def _messages(prompt: str) -> list[dict]:
+    return [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
+def _complete(prompt: str, tokens: int, response_format: dict):
+    """One completion through the rate limiter, retried on rate limits and server errors."""
+    return limited_complete(get_backend(), tpm_limiter, _messages(prompt), tokens + EXPECTED_OUTPUT_TOKENS,
+                            response_format)
+
+
+def _parse_or_crash(content: str, array_keys: list[str], what: str) -> tuple[dict, bool]:
+    """Parsed answer and whether it was complete, only complete items are kept from a broken one."""
+    parsed, complete = salvage_json(content, array_keys)
+
+    if parsed is None:
         with open("test/crash.py", "w") as f:
-            f.write(chat_completion.choices[0].message.content)
-        print(f"\n\nCrashed on gen :( tail: {chat_completion.choices[0].message.content[-200:]}\n\n")
-        exit()
+            f.write(content)
+        raise ExtractionError(f"Unparsable {what}, tail: {content[-200:]}")
+
+    return parsed, complete
+
+
+def _filter_gen_info(groups: list[list[dict]]) -> list[dict]:
+    prompt = GEN_INFO_FILTER_PROMPT.format(infos=str(groups))
+    choice = _complete(prompt, len(ENCODER.encode(prompt)), OPENAI_SCHEMA_FILTER)
+
+    merged, _ = _parse_or_crash(choice.content, ["general_info"], "general info")
+    return merged["general_info"]
+
+
+def _filter_gen_info_cached(groups: list[list[dict]], store: ExtractionStore) -> list[dict]:
+    key = content_hash(GEN_INFO_FILTER_PROMPT, json.dumps(OPENAI_SCHEMA_FILTER, sort_keys=True), json.dumps(groups))
+    merged = store.filtered(key)
+
+    if merged is None:
+        merged = _filter_gen_info(groups)
+        store.add_filtered(key, merged)
+
+    return merged
+
+
+def _merge_gen_info(info: list[dict], store: ExtractionStore) -> list[dict]:
+    """
+    Deduplicate general info: duplicates that agree are merged locally, only the groups
+    that conflict go to the model, in parallel batches of at most `MERGE_BATCH_TOKENS`.
+    """
+    merged, ambiguous = premerge(info)
+    batches = batch_groups(ambiguous, MERGE_BATCH_TOKENS, lambda text: len(ENCODER.encode(text)))
+    print(f"Merged {len(info)} general info items into {len(merged)} locally, "
+          f"{len(ambiguous)} conflicting in {len(batches)} model calls.")
+
+    with ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS) as executor:
+        for resolved in executor.map(lambda groups: _filter_gen_info_cached(groups, store), batches):
+            merged.extend(resolved)
 
     return merged
 
 
-def extract_schemas(pages: dict[str, str]) -> dict:
+def _split_pages(pages: dict[str, str]) -> tuple[dict[str, str], dict[str, int]]:
+    """Chunk pages too big for one call, returns the pages/chunks along with their token sizes."""
+    chunk_tokens = CONTEXT_SIZE - 10000
+    split, sizes = {}, {}
+
+    for url, page in pages.items():  # Individual page chunker.
+        index = TokenIndex(page, ENCODER)  # The only time this page gets encoded.
+
+        if index.total <= CONTEXT_SIZE:
+            split[url], sizes[url] = page, index.total
+            continue
+
+        print(f"Chunking '{url.replace(urljoin(url, "/"), "")}' into ~{ceil(index.total / CONTEXT_SIZE)} chunks.", end="\r")
+        for i, (start, end) in enumerate(chunk_spans(index, chunk_tokens, get_backend(), limiter=tpm_limiter)):
+            split[f"{url}-#{i}"] = "\n".join(index.lines[start:end])
+            sizes[f"{url}-#{i}"] = index.tokens(start, end)
+
+    return split, sizes
+
+
+def _halve(chunk: dict[str, str]) -> list[dict[str, str]] | None:
+    """Split a call's content in two, by pages or a single page at the line closest to its middle."""
+    if len(chunk) > 1:
+        keys = list(chunk)
+        return [{key: chunk[key] for key in keys[:len(keys) // 2]},
+                {key: chunk[key] for key in keys[len(keys) // 2:]}]
+
+    (key, page), = chunk.items()
+    index = TokenIndex(page, ENCODER)
+
+    if len(index) < 2:
+        return None
+
+    middle = min(max(index.fitting(0, index.total // 2), 1), len(index) - 1)
+    return [{f"{key}-a": "\n".join(index.lines[:middle])}, {f"{key}-b": "\n".join(index.lines[middle:])}]
+
+
+def _extract(chunk: dict[str, str], tokens: int, depth: int = 0) -> tuple[dict, bool]:
+    """
+    Extract one call's worth of pages. When the output gets cut off at the token limit the
+    call is halved and both halves are sent, down to `MAX_SPLIT_DEPTH`. Past that the
+    complete endpoints of the cut off answer are kept. Returns the schema and whether it's complete.
+    """
+    choice = _complete(SCHEMA_EXTRACTION_PROMPT.format(docs=str(chunk)), tokens, OPENAI_SCHEMA_PARSE)
+    content = choice.content
+
+    if choice.finish_reason == "length" and depth < MAX_SPLIT_DEPTH and (parts := _halve(chunk)):
+        print(f"\nOutput of a {tokens} token call hit the limit, sending it again in two halves.")
+        schema, complete = {"endpoints": [], "general_info": []}, True
+
+        for part in parts:
+            part_tokens = PROMPT_TOKENS + sum(len(ENCODER.encode(page)) for page in part.values())
+            part_schema, part_complete = _extract(part, part_tokens, depth + 1)
+
+            schema["endpoints"].extend(part_schema["endpoints"])
+            schema["general_info"].extend(part_schema["general_info"])
+            complete = complete and part_complete
+
+        return schema, complete
+
+    schema, complete = _parse_or_crash(content, ["endpoints", "general_info"], "endpoints")
+    schema.setdefault("endpoints", [])
+    schema.setdefault("general_info", [])
+    complete = complete and choice.finish_reason != "length"
+
+    if not complete:
+        print(f"\nOutput cut off, salvaged {len(schema['endpoints'])} complete endpoints.")
+
+    return schema, complete
+
+
+def _extract_call(chunk: dict[str, str], tokens: int, store: ExtractionStore) -> dict:
+    """Run one extraction call of about `tokens` input tokens, safe to call from several threads at once."""
+    schema, complete = _extract(chunk, tokens)
+
+    if complete:  # A salvaged answer is still worth a new try next run.
+        store.add(chunk, schema)
+
+    return schema
+
+
+def _run_batch(calls: list[dict[str, str]], pending: list[int], results: list,
+               store: ExtractionStore, journal: RunJournal | None) -> None:
+    """
+    Send the `pending` calls through the Batch API and fill in their `results`.
+
+    Calls whose answer got cut off or failed are left empty, so they go through the
+    synchronous path afterwards, where they're split or retried.
+    """
+    backend = get_backend()
+    if not isinstance(backend, OpenAIBackend):
+        raise ValueError(f"Batch mode needs the OpenAI backend, not '{backend.name}'.")
+
+    batch_id = journal.batch if journal else None
+
+    if batch_id is None:
+        bodies = {f"call-{i}": backend.request(_messages(SCHEMA_EXTRACTION_PROMPT.format(docs=str(calls[i]))),
+                                               OPENAI_SCHEMA_PARSE)
+                  for i in pending}
+        batch_id = batches.submit(backend.client, bodies)
+
+        if journal:
+            journal.batch_submitted(batch_id)
+    else:
+        print(f"Resuming batch {batch_id}.")
+
+    finished = batches.wait(backend.client, batch_id)
+
+    for custom_id, body in batches.results(backend.client, finished).items():
+        i = int(custom_id.removeprefix("call-"))
+        choice = body["choices"][0]
+
+        if results[i] is not None or choice["finish_reason"] == "length":
+            continue
+
+        schema, complete = salvage_json(choice["message"]["content"] or "", ["endpoints", "general_info"])
+        if schema is None or not complete:
+            continue
+
+        results[i] = schema
+        store.add(calls[i], schema)
+
+        if journal:
+            journal.call_done(i, schema)
+
+
+def extract_schemas(pages: dict[str, str], journal: RunJournal | None = None, batch: bool = False) -> dict:
+    """
+    Extract endpoint schemas from all pages. With a `journal` the call plan and every
+    finished call are recorded, and calls the journal already has a result for are skipped.
+
+    With `batch` the calls are sent through the Batch API, at half the price but without
+    any promise on when they finish. The planning and merging are the same either way.
+    """
+    store = _store()
+
     print("Checking pages for need of chunking...")
-    for url, page in deepcopy(pages).items():  # Individual page chunker.
-        page_size = len(ENCODER.encode(page))
-        if page_size > CONTEXT_SIZE:
-            print(f"Chunking '{url.replace(urljoin(url, "/"), "")}' into ~{ceil(page_size / CONTEXT_SIZE)} chunks.", end="\r")
-            pages.pop(url)
-            pages.update({f"{url}-#{i}": chunk for i, chunk in 
-                enumerate(chunk_page(client, 
-                                     MODEL,
-                                     page,
-                                     CONTEXT_SIZE - 10000))
-            })
+    pages, sizes = _split_pages(pages)
 
     schemas = {"endpoints": [], "general_info": []}
-    total = len(pages)
-    processed = 0
-
-    print("Page chunking done, extracting schemas.")
-    while pages:
-        chunk = {}
-        key = None
-        space_left = CONTEXT_SIZE
-
-        while pages:  # This second chunker grabs as many chunks (as prepped before as it can fit into 1 call/ctx window)
-            key = list(pages)[0]
-            page = pages[key]
-            page_size = len(ENCODER.encode(page))
-
-            if page_size > space_left:
-                break
-
-            chunk[key] = pages.pop(key)
-            space_left -= page_size
-
-        tpm_limiter.wait_until_budget_allows(page_size)
-
-        print(f"{processed}/{total} pages processed. Currently handling {len(chunk)} pages.{CLEARLINE}", end="\r")
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": SCHEMA_EXTRACTION_PROMPT.format(docs=str(chunk))
-                }
-            ],
-            model=MODEL,
-            response_format=OPENAI_SCHEMA_PARSE
-        )
-
-        try:
-            schema = json.loads(chat_completion.choices[0].message.content)
-
-            actual_tokens = chat_completion.usage.total_tokens
-            now = time.time()
-            with tpm_limiter._lock:
-                tpm_limiter._token_events.pop()
-                tpm_limiter._token_events.append((now, actual_tokens)) # replace estimate with actual usage
-        except: 
-            with open("test/crash.py", "w") as f:
-                f.write(chat_completion.choices[0].message.content)
-            print(f"\n\nCrashed on endpoints :( tail: {chat_completion.choices[0].message.content[-200:]}\n\n")
-            exit()
+
+    journaled = journal.plan if journal else None
+    if journaled:
+        # The plan only has the pages the store couldn't answer, the rest has to come from the store again.
+        planned = {key for keys in journaled[0] for key in keys}
+        reused, unplanned = store.reuse({key: page for key, page in pages.items() if key not in planned})
+
+    if journaled and planned <= pages.keys() and not unplanned:
+        # Same pages as the run being resumed, its plan still applies.
+        call_keys, tokens = journaled
+        print(f"Resuming run {journal.run_id}: {len(journal.results)}/{len(call_keys)} calls already done, "
+              f"reused {len(reused)} stored extractions.")
+    else:
+        reused, pages = store.reuse(pages)
+        plan = plan_calls(sizes={key: sizes[key] for key in pages}, capacity=CONTEXT_SIZE,
+                          overhead=PROMPT_TOKENS, group_prefixes=GROUP_BY_PREFIX)
+        call_keys, tokens = plan.calls, plan.tokens
+
+        if journal:
+            journal.planned(plan.calls, plan.tokens)
+
+        print(f"Page chunking done, reused {len(reused)} stored extractions. {plan.summary()}")
+
+    for schema in reused:
+        schemas["endpoints"].extend(schema["endpoints"])
+        schemas["general_info"].extend(schema["general_info"])
+
+    calls = [{key: pages[key] for key in keys} for keys in call_keys]
+    total = sum(map(len, calls))
+    failure = None
+
+    # Results are merged in call order, not completion order, so reruns give the same output.
+    results = [journal.results.get(i) if journal else None for i in range(len(calls))]
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if batch and pending:
+        _run_batch(calls, pending, results, store, journal)
+
+    with ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS) as executor:
+        futures = {executor.submit(_extract_call, chunk, tokens[i], store): i
+                   for i, chunk in enumerate(calls) if results[i] is None}
+        processed = total - sum(len(calls[i]) for i in futures.values())
+
+        for future in as_completed(futures):
+            i = futures[future]
+
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # Let the other calls finish so their results are kept, then fail.
+                failure = failure or e
+                continue
+
+            if journal:
+                journal.call_done(i, results[i])
+
+            processed += len(calls[i])
+            print(f"{processed}/{total} pages processed.{CLEARLINE*2}", end="\r")
+
+    if failure is not None:
+        raise failure
+
+    for schema in results:
         schemas["endpoints"].extend(schema["endpoints"])
         schemas["general_info"].extend(schema["general_info"])
 
-        processed += len(chunk)
-        print(f"{processed}/{total} pages processed.{CLEARLINE*2}", end="\r")
+    return _finish(schemas, store)
 
-    schemas["general_info"] = _filter_gen_info(schemas["general_info"])
+
+def _finish(schemas: dict, store: ExtractionStore) -> dict:
+    # Overlapping chunks and related pages yield the same endpoint more than once.
+    index = EndpointIndex(schemas["endpoints"])
+    print(index.report())
+    schemas["endpoints"] = index.endpoints()
+
+    schemas["general_info"] = _merge_gen_info(schemas["general_info"], store)
     with open("tmp.json", 'w') as f:
         json.dump(schemas, f, indent=4)
 
     return schemas
 
-def generate_code(schema: dict, base_url: str, api_name: str, output_file_loc: str):
-    scripts = wrap_api(schema, base_url, api_name)
 
+def _extract_packed(chunk: dict[str, str], sizes: dict[str, int], store: ExtractionStore) -> list[dict]:
+    """One online packed call, minus whatever the store already has."""
+    reused, chunk = store.reuse(chunk)
+
+    if chunk:
+        reused.append(_extract_call(chunk, PROMPT_TOKENS + sum(sizes[key] for key in chunk), store))
+
+    return reused
+
+
+def extract_stream(pages: Iterable[tuple[str, str]]) -> dict:
+    """
+    `extract_schemas` for pages that are still coming in, e.g. from a crawl in progress.
+
+    Pages are chunked and packed into calls as they arrive (see `OnlinePacker`) and every
+    full call is sent right away. At most twice `EXTRACTION_WORKERS` calls wait or run at
+    once, after that reading `pages` blocks, so a bounded producer is slowed down instead
+    of piling up pages. Stored results are reused per call.
+    """
+    store = _store()
+    packer = OnlinePacker(CONTEXT_SIZE, overhead=PROMPT_TOKENS, group_prefixes=GROUP_BY_PREFIX)
+    slots = BoundedSemaphore(EXTRACTION_WORKERS * 2)
+    texts, sizes = {}, {}
+    futures = []
+    received = 0
+
+    with ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS) as executor:
+        def send(keys: list[str]) -> None:
+            slots.acquire()
+            chunk = {key: texts.pop(key) for key in keys}
+            future = executor.submit(_extract_packed, chunk, {key: sizes.pop(key) for key in keys}, store)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+        for url, page in pages:
+            split, split_sizes = _split_pages({url: page})
+            texts.update(split)
+            sizes.update(split_sizes)
+            received += 1
+
+            for key in split:
+                for keys, _ in packer.add(key, split_sizes[key]):
+                    send(keys)
+
+            done = sum(future.done() for future in futures)
+            print(f"{received} pages in, {done}/{len(futures)} calls done.{CLEARLINE*2}", end="\r")
+
+        for keys, _ in packer.flush():
+            send(keys)
+
+        print(f"All {received} pages in, waiting for {len(futures)} calls.{CLEARLINE*2}")
+
+    schemas = {"endpoints": [], "general_info": []}
+    # Merged in the order calls were packed, not completion order.
+    for future in futures:
+        for schema in future.result():
+            schemas["endpoints"].extend(schema["endpoints"])
+            schemas["general_info"].extend(schema["general_info"])
+
+    return _finish(schemas, store)
+
+def generate_code(schema: dict, base_url: str, api_name: str, output_file_loc: str, layout: str = "files"):
+    """
+    Write the generated code to `output_file_loc`, a folder for the 'files' and 'package'
+    layouts. For the single 'module' layout it may also be the .py file to write.
+    """
+    scripts = wrap_api(schema, base_url, api_name, layout=layout)
+
+    if layout == "module" and output_file_loc.endswith(".py"):
+        scripts = {os.path.basename(output_file_loc): next(iter(scripts.values()))}
+        output_file_loc = os.path.dirname(output_file_loc)
+
+    os.makedirs(output_file_loc or ".", exist_ok=True)
     for filename, code in scripts.items():
-        with open(output_file_loc + filename, "w") as f:
+        with open(os.path.join(output_file_loc, filename), "w") as f:
             f.write(code)
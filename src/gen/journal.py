@@ -0,0 +1,102 @@
+import json
+import os
+import secrets
+import threading
+from datetime import datetime
+
+RUNS_DIR = ".runs"
+
+
+class RunJournal:
+    """
+    Append-only log of one generation run, so a run that died can be picked up where it stopped.
+
+    Every step is appended as a JSON line as soon as it finishes: the run's settings,
+    each crawled page, each fully crawled domain, the extraction call plan, the batch
+    job it was submitted as (if any) and the result of every call. Loading the file
+    replays those lines, so after a crash only the unfinished work is done again. A later
+    plan replaces an earlier one together with the results recorded for it.
+    """
+
+    def __init__(self, run_id: str, root: str = RUNS_DIR) -> None:
+        self.run_id = run_id
+        self._path = os.path.join(root, f"{run_id}.jsonl")
+        self._lock = threading.Lock()
+
+        self.config: dict = {}
+        self.pages: dict[str, str] = {}
+        self.crawled: set[tuple[str, str]] = set()
+        self.plan: tuple[list[list[str]], list[int]] | None = None
+        self.results: dict[int, dict] = {}
+        self.batch: str | None = None  # Batch API job running the current plan's calls.
+        self.finished = False
+
+        os.makedirs(root, exist_ok=True)
+
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._load(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # Half-written last line of the run that died.
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def start(cls, config: dict, root: str = RUNS_DIR) -> "RunJournal":
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(2)}"
+        journal = cls(run_id, root)
+        journal._append({"type": "config", "config": config})
+
+        return journal
+
+    @classmethod
+    def resume(cls, run_id: str, root: str = RUNS_DIR) -> "RunJournal":
+        if not os.path.exists(os.path.join(root, f"{run_id}.jsonl")):
+            raise FileNotFoundError(f"No run '{run_id}' in {root}/")
+
+        return cls(run_id, root)
+
+    def _load(self, record: dict) -> None:
+        match record["type"]:
+            case "config":
+                self.config = record["config"]
+            case "page":
+                self.pages[record["url"]] = record["text"]
+            case "crawled":
+                self.crawled.add((record["starting_url"], record["domain_url"]))
+            case "plan":
+                self.plan = (record["calls"], record["tokens"])
+                self.results = {}
+                self.batch = None
+            case "batch":
+                self.batch = record["batch_id"]
+            case "call":
+                self.results[record["index"]] = record["result"]
+            case "done":
+                self.finished = True
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._load(record)
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def page(self, url: str, text: str) -> None:
+        self._append({"type": "page", "url": url, "text": text})
+
+    def domain_crawled(self, starting_url: str, domain_url: str) -> None:
+        self._append({"type": "crawled", "starting_url": starting_url, "domain_url": domain_url})
+
+    def planned(self, calls: list[list[str]], tokens: list[int]) -> None:
+        self._append({"type": "plan", "calls": calls, "tokens": tokens})
+
+    def batch_submitted(self, batch_id: str) -> None:
+        self._append({"type": "batch", "batch_id": batch_id})
+
+    def call_done(self, index: int, result: dict) -> None:
+        self._append({"type": "call", "index": index, "result": result})
+
+    def done(self) -> None:
+        self._append({"type": "done"})
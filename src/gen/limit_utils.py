@@ -1,54 +1,169 @@
+import re
 import threading
 import time
 from collections import deque
 
 
+class Reservation:
+    """
+    Budget held in the limiter for a single request.
+
+    Starts out as an estimate, call `reconcile` with the real usage once the response is in
+    so the limiter frees (or charges) the difference.
+    """
+
+    def __init__(self, limiter: "SlidingWindowRateLimiter", timestamp: float, tokens: int, requests: int = 1) -> None:
+        self._limiter = limiter
+        self.timestamp = timestamp
+        self.tokens = tokens
+        self.requests = requests
+        self.expired = False  # Set once it slid out of the window, reconciling it is a no-op then.
+
+    def reconcile(self, actual_tokens: int) -> None:
+        self._limiter._reconcile(self, actual_tokens)
+
+
+def _parse_duration(value: str) -> float:
+    """OpenAI style reset durations like '1s', '6m0s' or '20ms', in seconds."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+
+    if not parts:
+        return float(value)
+
+    return sum(float(n) * units[unit] for n, unit in parts)
+
+
 class SlidingWindowRateLimiter:
     """
-    Enforces the model-level tokens-per-minute (TPM) quota issued by OpenAI.
+    Enforces the model-level requests-per-minute (RPM) and tokens-per-minute (TPM) quotas issued by OpenAI.
 
-    The limiter keeps a rolling 60-second window of token “charges”.
-    A thread that wants to send a request:
+    The limiter keeps a rolling 60-second window of reservations, with running totals
+    so checking the budget is O(1). A thread that wants to send a request:
         1.  estimates how many tokens it will cost
-        2.  blocks until that many tokens fit in the window
-        3.  inserts a record (timestamp, tokens) to reserve the budget
-        4.  waits until the request could be done
+        2.  blocks in `reserve` until one more request and that many tokens fit in the window
+        3.  sends the request and reconciles the reservation with the usage the API reported
+        4.  feeds the response headers to `update_from_headers`, so usage by other
+            clients of the same key and server-side backoff requests are respected
     """
 
-    def __init__(self, tpm_limit: int, window_seconds: int = 60) -> None:
+    def __init__(self, tpm_limit: int, rpm_limit: int | None = None, window_seconds: int = 60) -> None:
         self.tpm_limit = tpm_limit
+        self.rpm_limit = rpm_limit
         self.window_seconds = window_seconds
-        self._token_events: deque[tuple[float, int]] = deque()
-        self._lock = threading.Lock()
+
+        self._events: deque[Reservation] = deque()
+        self._tokens = 0
+        self._requests = 0
+        self._blocked_until = 0.0
+        self._cond = threading.Condition()
 
     def _drop_expired_events(self, now: float) -> None:
-        """Remove events older than the sliding-window horizon."""
-        while self._token_events and now - self._token_events[0][0] >= self.window_seconds:
-            self._token_events.popleft()
+        """Remove events older than the sliding-window horizon. Caller holds the lock."""
+        while self._events and now - self._events[0].timestamp >= self.window_seconds:
+            event = self._events.popleft()
+            event.expired = True
+            self._tokens -= event.tokens
+            self._requests -= event.requests
+
+    def _charge(self, now: float, tokens: int, requests: int) -> Reservation:
+        event = Reservation(self, now, tokens, requests)
+        self._events.append(event)
+        self._tokens += tokens
+        self._requests += requests
+
+        return event
+
+    def _fits(self, tokens: int) -> bool:
+        if self.rpm_limit is not None and self._requests + 1 > self.rpm_limit:
+            return False
+
+        # A single request bigger than the whole budget still has to go out at some point.
+        return self._tokens + tokens <= self.tpm_limit or not self._events
 
-    def _tokens_in_window(self, now: float) -> int:
-        """Return the total tokens currently counted against the window."""
-        self._drop_expired_events(now)
-        return sum(tokens for _, tokens in self._token_events)
+    def _charge_external(self, now: float, tokens: int, requests: int, reset: str | None) -> None:
+        """Charge usage the server saw but this limiter didn't, expiring at the server's reset."""
+        reset_s = min(_parse_duration(reset), self.window_seconds) if reset else self.window_seconds
+        event = Reservation(self, now - self.window_seconds + reset_s, tokens, requests)
 
-    def wait_until_budget_allows(self, tokens_needed: int) -> None:
+        # Keep the deque ordered by timestamp, expiry only looks at the front.
+        i = len(self._events)
+        while i and self._events[i - 1].timestamp > event.timestamp:
+            i -= 1
+
+        self._events.insert(i, event)
+        self._tokens += tokens
+        self._requests += requests
+
+    def reserve(self, tokens_needed: int) -> Reservation:
         """
-        Block the caller until `tokens_needed` can be spent without
-        exceeding the TPM limit.
+        Block the caller until one more request costing `tokens_needed` fits
+        in both limits, then reserve that budget.
         """
-        while True:
-            with self._lock:
+        waited = False
+
+        with self._cond:
+            while True:
                 now = time.time()
-                used = self._tokens_in_window(now)
-                free_budget = self.tpm_limit - used
+                self._drop_expired_events(now)
+
+                if now >= self._blocked_until and self._fits(tokens_needed):
+                    return self._charge(now, tokens_needed, 1)
+
+                # Wake up when the server block lifts, or else when the oldest event expires.
+                # Reconciled reservations notify earlier.
+                if now < self._blocked_until:
+                    wake = self._blocked_until
+                else:
+                    wake = self._events[0].timestamp + self.window_seconds if self._events else now
+                sleep_for = wake - now + 0.05
+
+                if not waited:
+                    print(f"Waiting up to {sleep_for:.1f}s for rate limit.")
+                    waited = True
+
+                self._cond.wait(sleep_for)
+
+    def wait_until_budget_allows(self, tokens_needed: int) -> Reservation:
+        return self.reserve(tokens_needed)
+
+    def _reconcile(self, event: Reservation, actual_tokens: int) -> None:
+        with self._cond:
+            if not event.expired:
+                self._tokens += actual_tokens - event.tokens
+            event.tokens = actual_tokens
+
+            self._cond.notify_all()
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Align the limiter with the `x-ratelimit-*` and `retry-after` headers of a response.
+
+        When the server reports less budget left than this limiter thinks there is (other
+        processes using the same key), the difference is charged until the server's reset time.
+        """
+        headers = {k.lower(): v for k, v in headers.items()}
+        now = time.time()
+
+        with self._cond:
+            self._drop_expired_events(now)
+
+            retry_after = headers.get("retry-after-ms")
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, now + float(retry_after) / 1000)
+            elif headers.get("retry-after") is not None:
+                try:
+                    self._blocked_until = max(self._blocked_until, now + float(headers["retry-after"]))
+                except ValueError:
+                    pass  # HTTP date form, OpenAI doesn't send it.
 
-                if tokens_needed <= free_budget:
-                    # adds the events queue
-                    self._token_events.append((now, tokens_needed))
-                    return
+            tokens_left = headers.get("x-ratelimit-remaining-tokens")
+            if tokens_left is not None and (missing := self.tpm_limit - self._tokens - int(tokens_left)) > 0:
+                self._charge_external(now, missing, 0, headers.get("x-ratelimit-reset-tokens"))
 
-                # Oldest event dictates when budget frees up
-                sleep_for = self.window_seconds - (now - self._token_events[0][0]) + 0.05
+            requests_left = headers.get("x-ratelimit-remaining-requests")
+            if (requests_left is not None and self.rpm_limit is not None
+                    and (missing := self.rpm_limit - self._requests - int(requests_left)) > 0):
+                self._charge_external(now, 0, missing, headers.get("x-ratelimit-reset-requests"))
 
-            print(f"Waiting {sleep_for:.1f}s for token rate limit.")
-            time.sleep(sleep_for)
+            self._cond.notify_all()
@@ -0,0 +1,303 @@
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+FUZZY_RATIO = 0.92  # How alike two compacted names have to be to count as the same variable.
+MAX_EXPLANATIONS = 3  # Distinct explanations kept per merged variable, most common first.
+EMPTY_DEFAULTS = {"", "none", "null"}
+MAX_NAMES_PER_ENDPOINT = 3  # More names than this under one URL means the URL is wrong, not the duplicates.
+TYPE_ORDER = ["object", "string", "float", "integer", "boolean"]  # Ties between parameter types go to the widest.
+
+# '{id}', ':id', '<id>' and '<int:id>' path parameters.
+PLACEHOLDER = re.compile(r"\{([^{}/]*)\}|(?<=/):([A-Za-z_]\w*)|<(?:[^<>/:]*:)?([^<>/]*)>")
+
+
+def normalize_name(name: str) -> str:
+    """'apiKey', 'API-Key' and ' api key ' all become 'api_key'."""
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name.strip())
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _compact(name: str) -> str:
+    """Looser key on top of the normalized name, so 'apikey'/'api_key' and 'scope'/'scopes' meet."""
+    return name.replace("_", "").rstrip("s") or name
+
+
+def _default(value: str) -> str:
+    value = str(value).strip().strip("'\"")
+    return "" if value.lower() in EMPTY_DEFAULTS else value
+
+
+def _most_common(counts: Counter) -> str:
+    """Most used spelling, the shortest one on a tie so 'api_key' beats 'api_keys'."""
+    return min(counts, key=lambda n: (-counts[n], len(n), n))
+
+
+def _merge_explanations(explanations: list[str]) -> str:
+    """The most common distinct explanations, leaving out ones another kept explanation already contains."""
+    counts = Counter(e.strip() for e in explanations if e and e.strip())
+    kept: list[str] = []
+
+    for explanation, _ in sorted(counts.items(), key=lambda item: (-item[1], -len(item[0]), item[0])):
+        folded = explanation.lower()
+        if any(folded in k.lower() for k in kept):
+            continue
+
+        kept = [k for k in kept if k.lower() not in folded]
+        kept.append(explanation)
+
+        if len(kept) == MAX_EXPLANATIONS:
+            break
+
+    return " ".join(kept)
+
+
+@dataclass
+class InfoGroup:
+    """General info items that look like the same variable."""
+    items: list[dict] = field(default_factory=list)
+    names: Counter = field(default_factory=Counter)
+    fuzzy: bool = False  # Some names only matched fuzzily, e.g. 'webhook_secret' and 'webhook_secret_id'.
+
+    @property
+    def name(self) -> str:
+        return _most_common(self.names)
+
+    def variants(self) -> dict[tuple[str, ...], list[dict]]:
+        """
+        Items by their (type, default), the group is consistent when there's one of those.
+        In a fuzzy group the name is part of the key, they may be different variables.
+        """
+        variants: dict[tuple[str, ...], list[dict]] = {}
+        for item in self.items:
+            key = (item["type"], _default(item["default_val"]))
+            if self.fuzzy:
+                key = (_compact(normalize_name(item["var_name"])), *key)
+            variants.setdefault(key, []).append(item)
+
+        return variants
+
+    def merged(self, items: list[dict] | None = None) -> dict:
+        items = items or self.items
+        default = _default(items[0]["default_val"])
+        name = _most_common(Counter(normalize_name(i["var_name"]) for i in items)) if self.fuzzy else self.name
+
+        return {"var_name": name, "type": items[0]["type"], "default_val": default or "None",
+                "explanation": _merge_explanations([i["explanation"] for i in items])}
+
+    def conflict(self) -> list[dict]:
+        """One merged item per (type, default) variant, what the model gets to choose between."""
+        return [self.merged(items) for items in self.variants().values()]
+
+
+def group_info(info: list[dict]) -> list[InfoGroup]:
+    """
+    Group general info items by normalized name, then fuzzily. Names are only compared to
+    names starting with the same two letters, which keeps this fast on large APIs.
+    """
+    exact: dict[str, InfoGroup] = {}
+    for item in info:
+        name = normalize_name(item["var_name"])
+        group = exact.setdefault(_compact(name), InfoGroup())
+        group.items.append(item)
+        group.names[name] += 1
+
+    groups: list[InfoGroup] = []
+    keys: list[str] = []
+    blocks: dict[str, list[int]] = {}
+
+    for key, group in exact.items():
+        block = blocks.setdefault(key[:2], [])
+        match = next((i for i in block if SequenceMatcher(None, keys[i], key).ratio() >= FUZZY_RATIO), None)
+
+        if match is None:
+            block.append(len(groups))
+            groups.append(group)
+            keys.append(key)
+        else:
+            groups[match].items.extend(group.items)
+            groups[match].names.update(group.names)
+            groups[match].fuzzy = True
+
+    return groups
+
+
+def premerge(info: list[dict]) -> tuple[list[dict], list[InfoGroup]]:
+    """
+    Merge general info without the model where the duplicates agree.
+
+    Returns the merged items, in order of first appearance, and the groups whose items
+    disagree on type or default, or whose names only matched fuzzily. Those still need a
+    judgement call.
+    """
+    merged, ambiguous = [], []
+
+    for group in group_info(info):
+        if not group.fuzzy and len(group.variants()) == 1:
+            merged.append(group.merged())
+        else:
+            ambiguous.append(group)
+
+    return merged, ambiguous
+
+
+def batch_groups(groups: list[InfoGroup], max_tokens: int, count_tokens) -> list[list[list[dict]]]:
+    """Pack the conflicts of `groups` into batches of at most `max_tokens` (by `count_tokens(str)`)."""
+    batches, batch, used = [], [], 0
+
+    for group in groups:
+        conflict = group.conflict()
+        tokens = count_tokens(str(conflict))
+
+        if batch and used + tokens > max_tokens:
+            batches.append(batch)
+            batch, used = [], 0
+
+        batch.append(conflict)
+        used += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def url_template(url: str) -> tuple[str, str]:
+    """
+    Index key and canonical form of an endpoint URL. The key is the path, without a
+    trailing slash and with path parameters unnamed, plus the sorted query, so '/users/:id'
+    matches 'https://api.x.com/users/{user_id}/' but 'api.php?action=query' doesn't match
+    'api.php?action=parse'. The canonical form writes every path parameter as '{name}',
+    which is what the generated code formats in, and keeps the query as it was.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    prefix = f"{parts.scheme}://{parts.netloc}" if parts.netloc else ""
+    query = f"?{parts.query}" if parts.query else ""
+
+    key = PLACEHOLDER.sub("{}", path)
+    if parts.query:
+        key += "?" + urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    template = PLACEHOLDER.sub(lambda m: "{" + next(g for g in m.groups() if g is not None) + "}", path)
+    return key, prefix + template + query
+
+
+def _merge_parameters(variants: list[list[dict]], output: bool) -> list[dict]:
+    """
+    Union of the parameter lists of duplicate endpoints, matched by normalized name, in order
+    of first appearance. The most common type wins (the widest on a tie), and a parameter is
+    required / an array as soon as one duplicate says so.
+    """
+    found: dict[str, list[dict]] = {}
+    for params in variants:
+        for param in params:
+            found.setdefault(normalize_name(param["name"]), []).append(param)
+
+    merged = []
+    for params in found.values():
+        types = Counter(p["type"] for p in params)
+        param = {"name": _most_common(Counter(p["name"] for p in params)),
+                 "type": min(types, key=lambda t: (-types[t], TYPE_ORDER.index(t) if t in TYPE_ORDER else len(TYPE_ORDER), t))}
+
+        if output:
+            param["is_array"] = any(p.get("is_array") for p in params)
+        else:
+            param["required"] = any(p.get("required") for p in params)
+
+        param["description"] = _merge_explanations([p.get("description", "") for p in params])
+        merged.append(param)
+
+    return merged
+
+
+class EndpointIndex:
+    """
+    Extracted endpoints keyed by method and URL template, so the same endpoint extracted from
+    overlapping chunks or related pages ends up as one. Duplicates are merged with fixed rules
+    that don't depend on the order they come in (see `_merge_parameters`), and distinct
+    endpoints that got the same name are renamed so they don't overwrite each other's file.
+
+    When more than `MAX_NAMES_PER_ENDPOINT` differently named endpoints share a URL, the
+    model most likely gave the documentation page as their URL, those are only merged by name.
+    """
+
+    def __init__(self, endpoints: list[dict] = ()) -> None:
+        self._found: dict[tuple[str, str], list[dict]] = {}
+        self.extend(endpoints)
+
+    def add(self, endpoint: dict) -> None:
+        key, _ = url_template(endpoint["url"])
+        self._found.setdefault((endpoint["method"].upper(), key), []).append(endpoint)
+
+    def extend(self, endpoints: list[dict]) -> None:
+        for endpoint in endpoints:
+            self.add(endpoint)
+
+    def _groups(self) -> list[tuple[str, str, list[dict]]]:
+        """(method, URL key, duplicates) of every endpoint the index ends up with."""
+        groups = []
+        for (method, key), variants in self._found.items():
+            by_name: dict[str, list[dict]] = {}
+            for endpoint in variants:
+                by_name.setdefault(normalize_name(endpoint["name"]), []).append(endpoint)
+
+            if len(by_name) > MAX_NAMES_PER_ENDPOINT:
+                groups.extend((method, key, named) for named in by_name.values())
+            else:
+                groups.append((method, key, variants))
+
+        return groups
+
+    def __len__(self) -> int:
+        return len(self._groups())
+
+    def _merge(self, method: str, variants: list[dict]) -> dict:
+        # An absolute URL over a relative one, then the most common.
+        urls = Counter(e["url"] for e in variants)
+        url = url_template(min(urls, key=lambda u: ("://" not in u, -urls[u], len(u), u)))[1]
+
+        return {"name": _most_common(Counter(e["name"] for e in variants)),
+                "url": url,
+                "args_in_url": any(e["args_in_url"] for e in variants) or "{" in url,
+                "method": method,
+                "input_parameters": _merge_parameters([e["input_parameters"] for e in variants], output=False),
+                "output_parameters": _merge_parameters([e["output_parameters"] for e in variants], output=True),
+                "description": _merge_explanations([e.get("description", "") for e in variants])}
+
+    def endpoints(self) -> list[dict]:
+        merged = [self._merge(method, variants) for method, _, variants in self._groups()]
+        names = Counter(normalize_name(e["name"]) for e in merged)
+        taken = set()
+
+        # Suffixes are handed out in a fixed order, so a rerun names every endpoint the same.
+        for endpoint in sorted(merged, key=lambda e: (e["method"], e["url"], json.dumps(e, sort_keys=True))):
+            name = endpoint["name"]
+            if names[normalize_name(name)] > 1:
+                name = f"{name} {endpoint['method'].lower()}"
+
+            n = 2
+            while normalize_name(name) in taken:
+                name, n = f"{endpoint['name']} {endpoint['method'].lower()} {n}", n + 1
+
+            endpoint["name"] = name
+            taken.add(normalize_name(name))
+
+        return merged
+
+    def collisions(self) -> list[tuple[str, str, int]]:
+        """(method, URL key, times found) of every endpoint that was extracted more than once, most found first."""
+        found = [(method, key, len(variants)) for method, key, variants in self._groups() if len(variants) > 1]
+        return sorted(found, key=lambda collision: -collision[2])
+
+    def report(self, top: int = 5) -> str:
+        groups, collisions = self._groups(), self.collisions()
+        if not collisions:
+            return f"{len(groups)} endpoints, no duplicates."
+
+        total = sum(len(variants) for _, _, variants in groups)
+        return (f"Merged {total} extracted endpoints into {len(groups)}, {len(collisions)} were found more than once: "
+                + ", ".join(f"{method} {key} ({n}x)" for method, key, n in collisions[:top]) + ".")
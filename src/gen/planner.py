@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+
+@dataclass
+class CallPlan:
+    """Which pages go into which extraction call, known before anything is sent."""
+    calls: list[list[str]] = field(default_factory=list)
+    tokens: list[int] = field(default_factory=list)  # Input tokens per call, prompt included.
+    capacity: int = 0
+    overhead: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def summary(self) -> str:
+        if not self.calls:
+            return "Nothing to extract."
+
+        content = self.total_tokens - self.overhead * len(self.calls)
+        fill = content / (len(self.calls) * self.capacity) if self.capacity else 1
+        return (f"Planned {len(self.calls)} extraction calls for {sum(map(len, self.calls))} pages, "
+                f"~{self.total_tokens:,} input tokens ({fill:.0%} average context use).")
+
+
+def url_prefix(key: str) -> str:
+    """Parent 'directory' of a page key, chunks of one page ('<url>-#3') share their page's prefix."""
+    url = urlparse(re.sub(r"-#\d+$", "", key))
+    return url.netloc + url.path.rstrip("/").rsplit("/", 1)[0]
+
+
+def plan_calls(sizes: dict[str, int], capacity: int, overhead: int = 0, group_prefixes: bool = True) -> CallPlan:
+    """
+    Pack pages into as few calls of at most `capacity` tokens as possible with first-fit decreasing.
+
+    Pages are placed largest first into the first call that still has room. With
+    `group_prefixes`, calls that already hold pages from the same URL prefix are tried
+    before the others, so related endpoints tend to share a context. `overhead` is the
+    prompt's own token count, added to every call in the reported totals.
+    Within a call pages keep their original order.
+    """
+    order = {key: i for i, key in enumerate(sizes)}
+    plan = CallPlan(capacity=capacity, overhead=overhead)
+    space: list[int] = []
+    prefixes: list[set[str]] = []
+
+    for key in sorted(sizes, key=lambda k: (-sizes[k], order[k])):
+        prefix = url_prefix(key)
+        fits = [i for i, free in enumerate(space) if free >= sizes[key]]
+
+        if group_prefixes:
+            fits = [i for i in fits if prefix in prefixes[i]] or fits
+
+        if fits:
+            i = fits[0]
+        else:
+            # Also the spot for pages bigger than the capacity, they get a call of their own.
+            i = len(plan.calls)
+            plan.calls.append([])
+            space.append(capacity)
+            prefixes.append(set())
+
+        plan.calls[i].append(key)
+        space[i] -= sizes[key]
+        prefixes[i].add(prefix)
+
+    for call in plan.calls:
+        call.sort(key=order.get)
+        plan.tokens.append(overhead + sum(sizes[key] for key in call))
+
+    return plan
+
+
+class OnlinePacker:
+    """
+    Packs pages into calls as they arrive, for when the full page list isn't known up front.
+
+    Up to `open_calls` calls are filled at once, first fit, preferring calls that already
+    hold the same URL prefix like `plan_calls`. A call is handed out when it is nearly full
+    or when a new call has to be opened and too many are open already, in which case the
+    fullest one goes. Pages bigger than the capacity get a call of their own right away.
+    Handed out calls are `(keys, tokens)` pairs, tokens including the `overhead`.
+    """
+
+    def __init__(self, capacity: int, overhead: int = 0, group_prefixes: bool = True,
+                 open_calls: int = 4, full_at: float = 0.95) -> None:
+        self.capacity = capacity
+        self.overhead = overhead
+        self.group_prefixes = group_prefixes
+        self.open_calls = open_calls
+        self.full_at = full_at
+
+        self._calls: list[tuple[list[str], set[str]]] = []
+        self._used: list[int] = []
+
+    def _close(self, i: int) -> tuple[list[str], int]:
+        keys, _ = self._calls.pop(i)
+        return keys, self.overhead + self._used.pop(i)
+
+    def add(self, key: str, size: int) -> list[tuple[list[str], int]]:
+        """Place a page, returns the calls that are ready to be sent because of it."""
+        if size >= self.capacity:
+            return [([key], self.overhead + size)]
+
+        prefix = url_prefix(key)
+        fits = [i for i, used in enumerate(self._used) if used + size <= self.capacity]
+
+        if self.group_prefixes:
+            fits = [i for i in fits if prefix in self._calls[i][1]] or fits
+
+        ready = []
+        if fits:
+            i = fits[0]
+        else:
+            if len(self._calls) >= self.open_calls:
+                ready.append(self._close(self._used.index(max(self._used))))
+
+            i = len(self._calls)
+            self._calls.append(([], set()))
+            self._used.append(0)
+
+        self._calls[i][0].append(key)
+        self._calls[i][1].add(prefix)
+        self._used[i] += size
+
+        if self._used[i] >= self.full_at * self.capacity:
+            ready.append(self._close(i))
+
+        return ready
+
+    def flush(self) -> list[tuple[list[str], int]]:
+        """Everything still open, once no more pages are coming."""
+        return [self._close(0) for _ in range(len(self._calls))]
@@ -0,0 +1,106 @@
+import json
+import random
+import re
+import time
+
+from openai import APIConnectionError, APIStatusError
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BASE_DELAY_S = 1.0
+MAX_DELAY_S = 60.0
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRY_STATUSES
+
+    return isinstance(error, APIConnectionError)  # Timeouts included.
+
+
+def with_backoff(call, limiter=None, retries: int = MAX_RETRIES, retryable=is_retryable):
+    """
+    Run `call()` until it succeeds, retrying errors `retryable` accepts (429s, 5xx and
+    connection errors) with exponential backoff and jitter. The error response's headers
+    go to `limiter`, so a `retry-after` holds back every other thread too, not just this one.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+
+            response = getattr(e, "response", None)
+            if limiter is not None and response is not None:
+                limiter.update_from_headers(response.headers)
+
+            delay = min(BASE_DELAY_S * 2 ** attempt, MAX_DELAY_S) * random.uniform(0.5, 1)
+            print(f"\n{type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{retries}).")
+            time.sleep(delay)
+
+
+def limited_complete(backend, limiter, messages: list[dict], tokens: int,
+                     response_format: dict | None = None, temperature: float | None = None):
+    """
+    One `backend` completion that holds `tokens` of `limiter`'s budget until the actual usage
+    is known, retried on rate limits and server errors. Without a limiter it's only retried.
+    """
+    def attempt():
+        if limiter is None:
+            return backend.complete(messages, response_format, temperature)
+
+        reservation = limiter.reserve(tokens)
+
+        try:
+            completion = backend.complete(messages, response_format, temperature)
+        except Exception:
+            reservation.reconcile(0)  # Refused or lost, either way not billed.
+            raise
+
+        reservation.reconcile(completion.total_tokens)
+        limiter.update_from_headers(completion.headers)
+
+        return completion
+
+    return with_backoff(attempt, limiter, retryable=backend.is_retryable)
+
+
+def _array_items(text: str, key: str) -> list:
+    """Every complete value of the JSON array under `key`, however the text after it ends."""
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*\[', text)
+    if match is None:
+        return []
+
+    decoder = json.JSONDecoder()
+    items, pos = [], match.end()
+
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos >= len(text) or text[pos] == "]":
+            return items
+
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            return items  # The cut off item, everything before it is complete.
+
+        items.append(item)
+
+
+def salvage_json(text: str, array_keys: list[str]) -> tuple[dict | None, bool]:
+    """
+    Parse a JSON object whose text may be cut off, e.g. by the output token limit.
+
+    Returns the object and True when it's valid. Otherwise the complete items of each
+    array in `array_keys` and False, or None when nothing could be recovered.
+    """
+    try:
+        return json.loads(text), True
+    except json.JSONDecodeError:
+        pass
+
+    salvaged = {key: _array_items(text, key) for key in array_keys}
+    return (salvaged if any(salvaged.values()) else None), False
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+
+STORE_DIR = ".cache/extractions"
+
+
+def content_hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExtractionStore:
+    """
+    Results of earlier extraction runs, so unchanged pages don't get sent to the model again.
+
+    Every record is keyed by content hashes, and the whole store lives in a file named after
+    `fingerprint` (a hash of the model, prompt and schema), so changing any of those starts
+    a fresh store. Records are appended as soon as a call finishes, which means a crashed run
+    keeps everything it already paid for.
+
+    Pages extracted together in one call can only be reused together, because there's no
+    telling which page an endpoint came from. If one of them changed, the whole group is
+    sent again.
+    """
+
+    def __init__(self, fingerprint: str, root: str = STORE_DIR) -> None:
+        self.fingerprint = fingerprint
+        self._path = os.path.join(root, f"{fingerprint[:16]}.jsonl")
+        self._lock = threading.Lock()
+
+        self._extractions: list[dict] = []
+        self._filtered: dict[str, list] = {}
+
+        os.makedirs(root, exist_ok=True)
+
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._load(json.loads(line))
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # Half-written last line of a crashed run.
+        except FileNotFoundError:
+            pass
+
+    def _load(self, record: dict) -> None:
+        match record["type"]:
+            case "extraction":
+                self._extractions.append(record)
+            case "filter":
+                self._filtered[record["key"]] = record["result"]
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._load(record)
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def key(self, content: str) -> str:
+        return content_hash(self.fingerprint, content)
+
+    def reuse(self, pages: dict[str, str]) -> tuple[list[dict], dict[str, str]]:
+        """
+        Split `pages` into the stored schemas that still apply and the pages that need extracting.
+
+        Newer records win when the same content was extracted more than once.
+        """
+        by_hash: dict[str, list[str]] = {}
+        for name, page in pages.items():
+            by_hash.setdefault(self.key(page), []).append(name)
+
+        available = Counter({h: len(names) for h, names in by_hash.items()})
+        reused = []
+
+        with self._lock:
+            records = list(reversed(self._extractions))
+
+        for record in records:
+            needed = Counter(record["members"])
+
+            if any(available[h] < n for h, n in needed.items()):
+                continue
+
+            available -= needed
+            reused.append(record["result"])
+
+            for h, n in needed.items():
+                del by_hash[h][:n]
+
+        remaining = {name for names in by_hash.values() for name in names}
+        return reused, {name: page for name, page in pages.items() if name in remaining}
+
+    def add(self, chunk: dict[str, str], result: dict) -> None:
+        self._append({"type": "extraction",
+                      "members": [self.key(page) for page in chunk.values()],
+                      "result": result})
+
+    def filtered(self, key: str) -> list | None:
+        return self._filtered.get(key)
+
+    def add_filtered(self, key: str, result: list) -> None:
+        self._append({"type": "filter", "key": key, "result": result})
@@ -0,0 +1,42 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+import tiktoken
+
+
+class TokenIndex:
+    """
+    Token counts of a page, encoded once.
+
+    Keeps the token count of every line (newline included) as prefix sums, so the token
+    size of any line range is a subtraction and "how far can a window reach" is a
+    binary search, instead of re-encoding the lines every time.
+    """
+
+    def __init__(self, text: str, encoder: tiktoken.Encoding) -> None:
+        self.lines = text.splitlines()
+        counts = (len(tokens) + 1 for tokens in encoder.encode_ordinary_batch(self.lines))
+        self._prefix = list(accumulate(counts, initial=0))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @property
+    def total(self) -> int:
+        return self._prefix[-1]
+
+    def tokens(self, start: int, end: int) -> int:
+        """Tokens in lines[start:end]."""
+        return self._prefix[end] - self._prefix[start]
+
+    def forward(self, start: int, budget: int) -> int:
+        """First `end` such that lines[start:end] holds at least `budget` tokens, or the line count."""
+        return min(bisect_left(self._prefix, self._prefix[start] + budget, lo=start), len(self.lines))
+
+    def backward(self, end: int, budget: int) -> int:
+        """Last `start` such that lines[start:end] holds at least `budget` tokens, or 0."""
+        return max(bisect_right(self._prefix, self._prefix[end] - budget, hi=end + 1) - 1, 0)
+
+    def fitting(self, start: int, budget: int) -> int:
+        """Last `end` such that lines[start:end] holds at most `budget` tokens."""
+        return max(bisect_right(self._prefix, self._prefix[start] + budget, lo=start) - 1, start)
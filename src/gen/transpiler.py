@@ -1,168 +1,336 @@
-import re
-from gen.types import Parameter, ParameterType, OutputParameter, OutputParameterType
-
-from jsonschema import validate
-from schemas import SCHEMA_PARSE
-from black import format_str, FileMode
-
-
-IMPORTS = """
-from FunctionClass import BaseFunction
-from ParameterClass import Parameter, ParameterType
-from OutputParameterClass import OutputParameter, OutputParameterType
-from InputClass import StandardInput
-from OutputClass import StandardOutput
-
-from dataclasses import dataclass
-import logging
-
-import re, json
-from requests import get, post
-"""
-
-API_CONFIG = """
-
-
-METHODS = {{"GET": get,
-           "POST": post}}
-
-@dataclass
-class APIClientConfig:
-    \"\"\"Configuration class for API settings\"\"\"
-    base_url="{base_url}"
-    name="{api_name}"
-
-{variables}
-
-    def get_oauth_params(self, method: str, url: str) -> dict[str, str]:
-        return {{}}
-
-    def validate(self):
-        # Asserts here
-        pass
-
-    def authenticate(self):
-        # For authentication done before calls, not during.
-        pass
-
-    def __init__(self): 
-        self.validate()
-        self.authenticate()
-
-    def request(self, method: str, url: str, args_in_url: bool, data: dict) -> dict[str, any]:
-        if args_in_url:
-            url = url.format(**data)  # TODO: Take in-url args out of payload. Probably best with template string.
-
-        response = METHODS[method](url, data=data)
-        
-        if response.status_code != 200:
-            raise Exception(response.text)
-
-        return json.loads(response.text)
-
-"""
-
-ENDPOINT_CODE = """
-from api_config import APIClientConfig
-
-
-class {class_name}(BaseFunction):
-    {endpoint_description}
-    name = "{name}"
-    url = "{url}"
-    args_in_url = {args_in_url}
-    method = "{method}"
-
-    def __init__(self):
-        self.api_config = APIClientConfig()
-    
-    def get_parameter_schema(self):
-        return [
-            {input_parameters}
-        ]
-
-    def get_output_schema(self):
-        return [
-            {output_parameters}
-        ]
-    
-    def process(self, input_data: StandardInput) -> StandardOutput:
-        try:
-            out = self.api_config.request({class_name}.method, 
-                                          {class_name}.url,
-                                          {class_name}.args_in_url,
-                                          input_data.validated_data)
-            return StandardOutput(out, self.get_output_schema())
-        except Exception as e:
-            error_msg = f"Error running function '{class_name}': {{str(e)}}"
-            logging.error(error_msg)
-            raise ValueError(error_msg)
-
-"""
-
-TYPES_IN = {"string": ParameterType.STRING,
-            "integer": ParameterType.INTEGER,
-            "boolean": ParameterType.BOOLEAN,
-            "float": ParameterType.FLOAT,
-            "object": OutputParameterType.OBJECT}
-
-TYPES_OUT = {"string": OutputParameterType.STRING,
-             "integer": OutputParameterType.INTEGER,
-             "boolean": OutputParameterType.BOOLEAN,
-             "float": OutputParameterType.FLOAT,
-             "object": OutputParameterType.OBJECT}
-
-
-OUTPUT_PARAM_FORMAT = "OutputParameter(name=\"{name}\", param_type={type}, is_array={is_array}),{comment}"
-PARAM_FORMAT = "Parameter(name=\"{name}\", param_type={type}, required={required}),{comment}"
-def _encode_parameters(params: list, output: bool) -> list[Parameter] | list[OutputParameter]:
-    # "OutputParameter(name=\"{p['name']}\", param_type={TYPES_IN[p['type']]}, is_array={p['is_array']})"
-     params = [OUTPUT_PARAM_FORMAT.format(name=p['name'],
-                                          type=TYPES_OUT[p['type']],
-                                          is_array=p['is_array'],
-                                          comment=f"  # {p['description'].replace('\n', '')}" if 'description' in p else "")
-               for p in params] if output else \
-              [PARAM_FORMAT.format(name=p['name'],
-                                   type=TYPES_IN[p['type']],
-                                   required=p['required'],
-                                   comment=f"  # {p['description'].replace('\n', '')}" if 'description' in p else "")
-               for p in params]
-
-     return ",\n\t\t\t".join(params)
-
-
-def _default_or_none(default: str, var_type: str) -> str:
-    if default == "None": return default
-
-    if not default: return "None"
-
-    if var_type == "str" and not default.startswith('"'):
-        return f'"{default}"'
-
-
-def wrap_api(schema: dict, base_url: str, api_name: str) -> dict[str, str]:
-    validate(instance=schema, schema=SCHEMA_PARSE)
-
-    # //TODO fix Fields with a default value must come after any fields without a default.
-    # //TODO fix when using filed of the class use self 
-
-    config_vars = [f"    # {v['explanation']}\n    {v['var_name'].replace('-', '_')}: {v['type']} = {_default_or_none(v['default_val'], v['type'])}" for v in schema["general_info"]]
-    scripts = {"api_config.py": IMPORTS + API_CONFIG.format(base_url=base_url, 
-                                                            api_name=api_name, 
-                                                            types_loc="shared",
-                                                            variables="\n\n".join(config_vars))}
-
-    for endpoint in schema["endpoints"]:
-        func_name = re.sub("[^\w_]", "", endpoint["name"].replace(" ", "_"))
-        scripts[func_name + ".py"] = (
-            IMPORTS + 
-            ENDPOINT_CODE.format(class_name=func_name, name=endpoint["name"], url=endpoint["url"],
-                                 args_in_url=endpoint["args_in_url"], method=endpoint["method"],
-                                 endpoint_description=f"\"\"\"{endpoint['description']}\"\"\"" if 'description' in endpoint else "",
-                                 input_parameters=_encode_parameters(endpoint["input_parameters"], 
-                                                                     output=False),
-                                 output_parameters=_encode_parameters(endpoint["output_parameters"], 
-                                                                      output=True))
-        )
-    return {filename: format_str(code, mode=FileMode()) for filename, code in scripts.items()}
-
+import ast
+import keyword
+import re
+from gen.types import ParameterType, OutputParameterType
+
+from jsonschema import validate
+from schemas import SCHEMA_PARSE
+
+try:
+    from gen.formatting import format_files
+except ImportError:  # black isn't installed, the emitted code is valid and readable as is.
+    format_files = None
+
+
+# Generated modules are built as ast nodes and written with ast.unparse, so names,
+# descriptions and URLs from the docs can't break the code whatever quotes or newlines
+# they contain. The fixed parts are parsed once from the snippets below.
+
+IMPORTS = """
+from FunctionClass import BaseFunction
+from ParameterClass import Parameter, ParameterType
+from OutputParameterClass import OutputParameter, OutputParameterType
+from InputClass import StandardInput
+from OutputClass import StandardOutput
+
+from dataclasses import dataclass
+import logging
+
+import re, json
+from requests import get, post
+"""
+
+API_CONFIG = """
+METHODS = {"GET": get,
+           "POST": post}
+
+
+def get_oauth_params(self, method: str, url: str) -> dict[str, str]:
+    return {}
+
+
+def validate(self):
+    \"\"\"Asserts here.\"\"\"
+    pass
+
+
+def authenticate(self):
+    \"\"\"For authentication done before calls, not during.\"\"\"
+    pass
+
+
+def __init__(self):
+    self.validate()
+    self.authenticate()
+
+
+def request(self, method: str, url: str, args_in_url: bool, data: dict) -> dict[str, any]:
+    if args_in_url:
+        url = url.format(**data)  # TODO: Take in-url args out of payload. Probably best with template string.
+
+    response = METHODS[method](url, data=data)
+
+    if response.status_code != 200:
+        raise Exception(response.text)
+
+    return json.loads(response.text)
+"""
+
+ENDPOINT_CODE = """
+from api_config import APIClientConfig
+
+
+def __init__(self):
+    self.api_config = APIClientConfig()
+
+
+def process(self, input_data: StandardInput) -> StandardOutput:
+    try:
+        out = self.api_config.request(self.method,
+                                      self.url,
+                                      self.args_in_url,
+                                      input_data.validated_data)
+        return StandardOutput(out, self.get_output_schema())
+    except Exception as e:
+        error_msg = f"Error running function '{type(self).__name__}': {str(e)}"
+        logging.error(error_msg)
+        raise ValueError(error_msg)
+"""
+
+# The package and single module layouts import only what each module uses, and share
+# one config between all endpoints instead of creating (and validating) one per instance.
+
+CONFIG_IMPORTS = """
+from dataclasses import dataclass
+from functools import cache
+import json
+from requests import get, post
+"""
+
+ENDPOINT_IMPORTS = """
+from FunctionClass import BaseFunction
+from ParameterClass import Parameter, ParameterType
+from OutputParameterClass import OutputParameter, OutputParameterType
+from InputClass import StandardInput
+from OutputClass import StandardOutput
+
+import logging
+"""
+
+SHARED_CONFIG = """
+@cache
+def get_config() -> APIClientConfig:
+    \"\"\"The config every endpoint shares, validated and authenticated once.\"\"\"
+    return APIClientConfig()
+
+
+from .api_config import get_config
+
+
+def __init__(self):
+    self.api_config = get_config()
+"""
+
+REGISTRY = """
+import importlib
+
+
+def __getattr__(name: str):
+    \"\"\"Import an endpoint's module the first time its class is used (PEP 562).\"\"\"
+    if name not in _CLASSES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    endpoint = getattr(importlib.import_module(f".{name}", __name__), name)
+    globals()[name] = endpoint  # Replaces the submodule attribute the import just set.
+    return endpoint
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *_CLASSES})
+
+
+def get_endpoint(name: str):
+    \"\"\"Endpoint class by its name in the documentation.\"\"\"
+    return __getattr__(ENDPOINTS[name])
+"""
+
+LAYOUTS = ("files", "package", "module")
+
+_IMPORTS = ast.parse(IMPORTS).body
+_CONFIG_IMPORTS = ast.parse(CONFIG_IMPORTS).body
+_ENDPOINT_IMPORTS = ast.parse(ENDPOINT_IMPORTS).body
+_METHODS, *_CONFIG_METHODS = ast.parse(API_CONFIG).body
+_CONFIG_IMPORT, _ENDPOINT_INIT, _ENDPOINT_PROCESS = ast.parse(ENDPOINT_CODE).body
+_GET_CONFIG, _GET_CONFIG_IMPORT, _SHARED_INIT = ast.parse(SHARED_CONFIG).body
+_REGISTRY_IMPORT, *_REGISTRY_FUNCTIONS = ast.parse(REGISTRY).body
+
+TYPES_IN = {"string": ParameterType.STRING,
+            "integer": ParameterType.INTEGER,
+            "boolean": ParameterType.BOOLEAN,
+            "float": ParameterType.FLOAT,
+            "object": OutputParameterType.OBJECT}
+
+TYPES_OUT = {"string": OutputParameterType.STRING,
+             "integer": OutputParameterType.INTEGER,
+             "boolean": OutputParameterType.BOOLEAN,
+             "float": OutputParameterType.FLOAT,
+             "object": OutputParameterType.OBJECT}
+
+CONFIG_TYPES = {"str": str, "int": int, "float": float}
+
+
+def identifier(name: str) -> str:
+    """A valid Python name for `name`, 'List repos' becomes 'List_repos'."""
+    name = re.sub(r"[^\w_]", "", name.replace(" ", "_").replace("-", "_"))
+
+    if not name or name[0].isdigit():
+        name = "_" + name
+    if keyword.iskeyword(name):
+        name += "_"
+
+    return name
+
+
+def _docstring(text: str, indent: int = 4) -> ast.Expr:
+    """Docstring statement, continuation lines indented to sit under the opening quotes."""
+    first, *rest = text.strip().splitlines() or [""]
+    if rest:
+        first = "\n".join([first, *(" " * indent + line.strip() for line in rest), " " * indent])
+
+    return ast.Expr(ast.Constant(first))
+
+
+def _enum(member) -> ast.Attribute:
+    return ast.Attribute(ast.Name(type(member).__name__), member.name)
+
+
+def _call(func: str, **kwargs) -> ast.Call:
+    return ast.Call(ast.Name(func), [], [ast.keyword(k, v if isinstance(v, ast.AST) else ast.Constant(v))
+                                         for k, v in kwargs.items()])
+
+
+def _describe(params: list[dict]) -> ast.Expr | None:
+    described = [f"{p['name']}: {' '.join(p['description'].split())}" for p in params if p.get("description")]
+    return _docstring("\n".join(described), indent=8) if described else None
+
+
+def _schema_method(name: str, params: list[dict], output: bool) -> ast.FunctionDef:
+    """`get_parameter_schema`/`get_output_schema`, parameter descriptions go in its docstring."""
+    calls = [_call("OutputParameter", name=p["name"], param_type=_enum(TYPES_OUT[p["type"]]), is_array=p["is_array"])
+             if output else
+             _call("Parameter", name=p["name"], param_type=_enum(TYPES_IN[p["type"]]), required=p["required"])
+             for p in params]
+
+    method = ast.parse(f"def {name}(self):\n    pass").body[0]
+    method.body = [doc for doc in [_describe(params)] if doc] + [ast.Return(ast.List(calls))]
+
+    return method
+
+
+def _default_value(default: str, var_type: str):
+    """The config variable's default as a Python value, None when there's no usable one."""
+    default = default.strip()
+    if default in ("", "None", "null"):
+        return None
+
+    if var_type == "str":
+        return default[1:-1] if len(default) > 1 and default[0] == default[-1] and default[0] in "'\"" else default
+
+    try:
+        return CONFIG_TYPES[var_type](default)
+    except (KeyError, ValueError):
+        return None
+
+
+def _config_class(general_info: list[dict], base_url: str, api_name: str) -> ast.ClassDef:
+    body = [_docstring("Configuration class for API settings"),
+            ast.Assign([ast.Name("base_url")], ast.Constant(base_url)),
+            ast.Assign([ast.Name("name")], ast.Constant(api_name))]
+
+    # //TODO fix when using filed of the class use self
+    for v in general_info:
+        body.append(ast.AnnAssign(ast.Name(identifier(v["var_name"])), ast.Name(v["type"]),
+                                  ast.Constant(_default_value(v["default_val"], v["type"])), simple=1))
+        if v["explanation"].strip():
+            body.append(_docstring(v["explanation"]))  # Attribute docstring, shown by IDEs and Sphinx.
+
+    return ast.ClassDef("APIClientConfig", [], [], body + _CONFIG_METHODS, [ast.Name("dataclass")], [])
+
+
+def _endpoint_class(endpoint: dict, class_name: str, shared_config: bool) -> ast.ClassDef:
+    body = [_docstring(endpoint["description"])] if endpoint.get("description", "").strip() else []
+    body += [ast.Assign([ast.Name(attr)], ast.Constant(endpoint[attr])) for attr in ("name", "url", "args_in_url", "method")]
+    body += [_SHARED_INIT if shared_config else _ENDPOINT_INIT,
+             _schema_method("get_parameter_schema", endpoint["input_parameters"], output=False),
+             _schema_method("get_output_schema", endpoint["output_parameters"], output=True),
+             _ENDPOINT_PROCESS]
+
+    return ast.ClassDef(class_name, [ast.Name("BaseFunction")], [], body, [], [])
+
+
+def _registry(classes: dict[str, str]) -> list[ast.stmt]:
+    """`ENDPOINTS` (documentation name: class name) and the lookups on it."""
+    return [ast.Assign([ast.Name("ENDPOINTS")], ast.Dict([ast.Constant(name) for name in classes],
+                                                          [ast.Constant(cls) for cls in classes.values()])),
+            *ast.parse("_CLASSES = set(ENDPOINTS.values())\n__all__ = sorted(_CLASSES)").body]
+
+
+def _files(schema: dict, base_url: str, api_name: str) -> dict[str, ast.Module]:
+    """One module per endpoint, each with its own config."""
+    modules = {"api_config.py": ast.Module(_IMPORTS + [_METHODS, _config_class(schema["general_info"], base_url, api_name)], [])}
+
+    for endpoint in schema["endpoints"]:
+        class_name = identifier(endpoint["name"])
+        modules[class_name + ".py"] = ast.Module(_IMPORTS + [_CONFIG_IMPORT, _endpoint_class(endpoint, class_name, False)], [])
+
+    return modules
+
+
+def _package(schema: dict, base_url: str, api_name: str) -> dict[str, ast.Module]:
+    """
+    A package: one module per endpoint sharing the config from `get_config`, and an
+    `__init__.py` registry that imports an endpoint's module only when it's first used.
+    """
+    config = _config_class(schema["general_info"], base_url, api_name)
+    modules = {"api_config.py": ast.Module(_CONFIG_IMPORTS + [_METHODS, config, _GET_CONFIG], [])}
+    classes = {}
+
+    for endpoint in schema["endpoints"]:
+        class_name = classes[endpoint["name"]] = identifier(endpoint["name"])
+        modules[class_name + ".py"] = ast.Module(
+            _ENDPOINT_IMPORTS + [_GET_CONFIG_IMPORT, _endpoint_class(endpoint, class_name, True)], [])
+
+    modules["__init__.py"] = ast.Module([_docstring(f"{api_name} API, endpoint classes are imported on first use.", 0),
+                                         _REGISTRY_IMPORT, *_registry(classes), *_REGISTRY_FUNCTIONS], [])
+    return modules
+
+
+def _module(schema: dict, base_url: str, api_name: str) -> dict[str, ast.Module]:
+    """Everything in a single module, named after the API."""
+    body = [*_ENDPOINT_IMPORTS, *_CONFIG_IMPORTS, _METHODS,
+            _config_class(schema["general_info"], base_url, api_name), _GET_CONFIG]
+    classes = {}
+
+    for endpoint in schema["endpoints"]:
+        class_name = classes[endpoint["name"]] = identifier(endpoint["name"])
+        body.append(_endpoint_class(endpoint, class_name, True))
+
+    body.append(_registry(classes)[0])
+    return {f"{identifier(api_name).lower()}.py": ast.Module(body, [])}
+
+
+def _unparse(module: ast.Module) -> str:
+    return ast.unparse(ast.fix_missing_locations(module)) + "\n"
+
+
+def wrap_api(schema: dict, base_url: str, api_name: str, formatted: bool = True, layout: str = "files") -> dict[str, str]:
+    """
+    Python source of every generated file by filename, in one of the `LAYOUTS`: separate
+    'files', a 'package' with a lazy endpoint registry, or a single 'module'. The code is
+    valid straight from `ast.unparse`, with `formatted` (and black installed) it's also
+    run through black.
+    """
+    validate(instance=schema, schema=SCHEMA_PARSE)
+
+    match layout:
+        case "files":
+            modules = _files(schema, base_url, api_name)
+        case "package":
+            modules = _package(schema, base_url, api_name)
+        case "module":
+            modules = _module(schema, base_url, api_name)
+        case _:
+            raise ValueError(f"Unknown layout '{layout}', use one of {', '.join(LAYOUTS)}.")
+
+    scripts = {filename: _unparse(module) for filename, module in modules.items()}
+    return format_files(scripts) if formatted and format_files else scripts
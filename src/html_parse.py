@@ -0,0 +1,66 @@
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from markdownify import MarkdownConverter
+
+try:
+    import lxml  # noqa: F401
+
+    TREE_BUILDER = "lxml"  # Several times faster than html.parser at building the tree.
+except ImportError:
+    TREE_BUILDER = "html.parser"
+
+
+def _as_text(html: str | bytes) -> str:
+    return html.decode("utf-8", errors="replace") if isinstance(html, bytes) else html
+
+
+def _in_scope(hrefs, base_url: str) -> set[str]:
+    # '/page/1#Header-2' -> 'https://full-url.com/page/1' (and doesn't break on already full URLs.)
+    links = {urljoin(base_url, href).split('#')[0] for href in hrefs}
+
+    return {l for l in links if l.startswith(base_url)}
+
+
+class _LinkCollector(HTMLParser):
+    """Keeps the href of every <a> start tag and nothing else, no tree is built."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)  # Text is ignored, don't bother unescaping it.
+        self.hrefs: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.hrefs.append(value)
+
+    handle_startendtag = handle_starttag
+
+
+def extract_links(html: str | bytes, base_url: str) -> set[str]:
+    """Links on the page within `base_url`, in one streaming pass over the HTML."""
+    collector = _LinkCollector()
+    collector.feed(_as_text(html))
+    collector.close()
+
+    return _in_scope(collector.hrefs, base_url)
+
+
+def parse_page(html: str | bytes, base_url: str, clean=None, **md_options) -> tuple[str, set[str]]:
+    """
+    Markdown and in-scope links of a page from a single parse.
+
+    `markdownify` parses the HTML into its own tree, so reading links with a second
+    BeautifulSoup parse paid for the page twice. Here one tree serves both.
+    `clean(soup)` can edit the tree in place after the links are read and before
+    the markdown is made, e.g. to strip boilerplate.
+    """
+    soup = BeautifulSoup(html, TREE_BUILDER)
+    links = _in_scope((a["href"] for a in soup.find_all("a", href=True)), base_url)
+
+    if clean is not None:
+        clean(soup)
+
+    return MarkdownConverter(**md_options).convert_soup(soup), links
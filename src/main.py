@@ -1,3 +1,4 @@
+import argparse
 import os
 import platform
 
@@ -6,7 +7,10 @@ from urllib.parse import urljoin
 from validators import url as validate_url
 
 from gen.gen import extract_schemas, generate_code
-from scrape import bfs_site
+from scrape import crawl_site, configure_cache
+from pipeline import run_pipeline
+from gen.journal import RunJournal
+from gen.transpiler import LAYOUTS
 
 
 api_name = "Github Actions"
@@ -48,20 +52,61 @@ documentation_domains = [
 
 
 
-def main():
+def main(journal: RunJournal | None = None):
     os.system("cls" if platform.system() == "Windows" else "clear")
 
     print("Tool is running, this could take a couple of minutes.")
-    pages = {}
 
-    for starting_url, domain_url in documentation_domains:
-        pages.update(bfs_site(starting_url, domain_url))
+    if journal is None:
+        journal = RunJournal.start({"api_name": api_name, "base_url": base_url,
+                                    "output_folder_loc": output_folder_loc,
+                                    "documentation_domains": documentation_domains})
+    print(f"Run id: {journal.run_id}")
 
-    schemas = extract_schemas(pages)
-    generate_code(schemas, base_url, api_name, output_folder_loc)
+    try:
+        if args.pipeline and not args.batch and not journal.pages:
+            schemas = run_pipeline(documentation_domains, journal=journal, dedupe=args.dedupe)
+        else:
+            pages = dict(journal.pages)
+
+            def keep(url: str, text: str) -> None:
+                journal.page(url, text)
+                pages[url] = text
+
+            for starting_url, domain_url in documentation_domains:
+                if (starting_url, domain_url) in journal.crawled:
+                    continue
+
+                crawl_site(starting_url, domain_url, dedupe=args.dedupe, sink=keep)
+                journal.domain_crawled(starting_url, domain_url)
+
+            schemas = extract_schemas(pages, journal, batch=args.batch)
+    except Exception:
+        print(f"\nRun {journal.run_id} failed, continue it with: python src/main.py --resume {journal.run_id}")
+        raise
+
+    generate_code(schemas, base_url, api_name, output_folder_loc, layout=args.layout)
+    journal.done()
     print(f"Code generated and saved at {output_folder_loc}")
 
 
+def resume(run_id: str):
+    """Continue a run that died, with the settings it was started with."""
+    global api_name, base_url, output_folder_loc, documentation_domains
+
+    journal = RunJournal.resume(run_id)
+    if journal.finished:
+        print(f"Run {run_id} already finished.")
+        return
+
+    api_name = journal.config["api_name"]
+    base_url = journal.config["base_url"]
+    output_folder_loc = journal.config["output_folder_loc"]
+    documentation_domains = [tuple(domain) for domain in journal.config["documentation_domains"]]
+
+    main(journal)
+
+
 def get_valid_url(prompt: str) -> str:
     while True:
         url = input(prompt)
@@ -216,4 +261,30 @@ def domain_menu():
                 return
                 
             
-main_menu()
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Scrape API documentation and generate Python code to call it.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore the page cache and download every documentation page again.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Extract schemas while the crawl is still running instead of after it.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Extract through the OpenAI Batch API: half the price, but it can take up to 24 hours.")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Drop near-duplicate pages (print views, version variants) during the crawl, "
+                             "pages documenting different endpoints are always kept.")
+    parser.add_argument("--layout", choices=LAYOUTS, default="files",
+                        help="Generate a file per endpoint (default), a package that imports endpoints lazily "
+                             "with one shared config, or a single module.")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="Continue a failed run from where it stopped, its id is printed when it starts.")
+
+    return parser.parse_args()
+
+
+args = parse_args()
+configure_cache(refresh=args.refresh)
+
+if args.resume:
+    resume(args.resume)
+else:
+    main_menu()
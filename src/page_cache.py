@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+CACHE_DIR = ".cache/pages"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+MAX_AGE_S = 24 * 60 * 60  # Entries younger than this are used without asking the server.
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    html_hash: str
+    md_hash: str | None = None
+    md_size: int = 0
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: float = 0.0  # Last time the server confirmed this body (200 or 304).
+    last_used: float = 0.0
+    size: int = 0
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class PageCache:
+    """
+    On-disk cache of fetched pages, their markdown and the validators needed for conditional GETs.
+
+    Bodies are stored content-addressed under `blobs/`, so identical pages share one file,
+    and an index maps each URL to its latest entry. Least recently used entries are
+    evicted once the blobs grow past `max_bytes`. With `refresh` nothing is read
+    from the cache, but fresh responses are still written to it.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES,
+                 max_age_s: float = MAX_AGE_S, refresh: bool = False) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.refresh = refresh
+
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+        try:
+            with open(self._index_path) as f:
+                self._entries = {url: CacheEntry(**e) for url, e in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            self._entries: dict[str, CacheEntry] = {}
+
+        self._total = sum(e.size for e in self._entries.values())
+        self._evict()  # In case max_bytes got lowered since the last run.
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _write_blob(self, data: bytes) -> tuple[str, int]:
+        digest = _hash(data)
+        path = self._blob_path(digest)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        return digest, len(data)
+
+    def _read_blob(self, digest: str) -> bytes | None:
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, url: str) -> CacheEntry | None:
+        if self.refresh:
+            return None
+
+        with self._lock:
+            return self._entries.get(url)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.fetched_at < self.max_age_s
+
+    def validators(self, entry: CacheEntry) -> dict[str, str]:
+        """Headers that turn the next request for this entry into a conditional GET."""
+        headers = {}
+
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        return headers
+
+    def html(self, entry: CacheEntry) -> bytes | None:
+        """Cached body of `entry`, marking it as recently used. None if the blob got evicted."""
+        body = self._read_blob(entry.html_hash)
+
+        if body is not None:
+            with self._lock:
+                entry.last_used = time.time()
+                self._dirty = True
+
+        return body
+
+    def revalidated(self, entry: CacheEntry) -> None:
+        """The server answered 304, the cached body is current again."""
+        with self._lock:
+            entry.fetched_at = entry.last_used = time.time()
+            self._dirty = True
+
+    def put(self, url: str, html: bytes, headers: dict[str, str]) -> CacheEntry:
+        digest, size = self._write_blob(html)
+        now = time.time()
+
+        with self._lock:
+            old = self._entries.get(url)
+            same_body = old is not None and old.html_hash == digest
+            md_size = old.md_size if same_body else 0
+            entry = CacheEntry(url, digest,
+                               md_hash=old.md_hash if same_body else None,
+                               md_size=md_size,
+                               etag=headers.get("etag"),
+                               last_modified=headers.get("last-modified"),
+                               fetched_at=now, last_used=now, size=size + md_size)
+
+            self._total += entry.size - (old.size if old else 0)
+            self._entries[url] = entry
+            self._dirty = True
+
+            self._evict()
+
+        return entry
+
+    def markdown(self, url: str, html: bytes) -> str | None:
+        """Cached markdown for `url`, as long as it was converted from this exact `html`."""
+        entry = self.get(url)
+
+        if entry is None or entry.md_hash is None or entry.html_hash != _hash(html):
+            return None
+
+        text = self._read_blob(entry.md_hash)
+        return text.decode("utf-8") if text is not None else None
+
+    def put_markdown(self, url: str, html: bytes, text: str) -> None:
+        with self._lock:
+            entry = self._entries.get(url)
+
+        if entry is None or entry.html_hash != _hash(html):
+            return
+
+        digest, size = self._write_blob(text.encode("utf-8"))
+
+        with self._lock:
+            # Replaces the markdown converted before, if any, so only the difference counts.
+            self._total += size - entry.md_size
+            entry.size += size - entry.md_size
+            entry.md_hash = digest
+            entry.md_size = size
+            self._dirty = True
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits. Caller holds the lock."""
+        if self._total <= self.max_bytes:
+            return
+
+        # Make some headroom so the blob sweep below doesn't run on every single put.
+        target = self.max_bytes * 0.9
+
+        for entry in sorted(self._entries.values(), key=lambda e: e.last_used):
+            if self._total <= target:
+                break
+
+            del self._entries[entry.url]
+            self._total -= entry.size
+
+        self._dirty = True
+
+        # Blobs are shared between entries, so only delete the ones nothing points to anymore.
+        referenced = {h for e in self._entries.values() for h in (e.html_hash, e.md_hash) if h}
+        blob_root = os.path.join(self.root, "blobs")
+
+        for prefix in os.listdir(blob_root):
+            for digest in os.listdir(os.path.join(blob_root, prefix)):
+                if digest not in referenced and not digest.endswith(".tmp"):
+                    os.remove(os.path.join(blob_root, prefix, digest))
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+
+            data = {url: asdict(e) for url, e in self._entries.items()}
+            self._dirty = False
+
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._index_path)
@@ -0,0 +1,57 @@
+import queue
+import threading
+
+from gen.gen import extract_stream
+from gen.journal import RunJournal
+from scrape import crawl_site
+
+PAGE_QUEUE_SIZE = 64  # Crawled pages waiting for extraction, the crawl stalls when this is full.
+
+_DONE = object()
+
+
+def run_pipeline(documentation_domains: list[tuple[str, str]], queue_size: int = PAGE_QUEUE_SIZE,
+                 journal: RunJournal | None = None, **crawl_options) -> dict:
+    """
+    Crawl the domains and extract schemas at the same time.
+
+    The crawl runs in its own thread and puts every finished page on a bounded queue,
+    which `extract_stream` reads from while calls are in flight. Both ends block when the
+    other falls behind, so memory stays bounded and the total time approaches the
+    slower of the two stages instead of their sum. With a `journal` crawled pages are
+    recorded as they come in.
+    """
+    pages: queue.Queue = queue.Queue(maxsize=queue_size)
+    crash: list[BaseException] = []
+
+    def keep(url: str, text: str) -> None:
+        if journal:
+            journal.page(url, text)
+        pages.put((url, text))
+
+    def crawl() -> None:
+        try:
+            for starting_url, domain_url in documentation_domains:
+                crawl_site(starting_url, domain_url, sink=keep, **crawl_options)
+
+                if journal:
+                    journal.domain_crawled(starting_url, domain_url)
+        except BaseException as e:
+            crash.append(e)
+        finally:
+            pages.put(_DONE)
+
+    def crawled():
+        while (item := pages.get()) is not _DONE:
+            yield item
+
+    crawler = threading.Thread(target=crawl, name="crawl", daemon=True)
+    crawler.start()
+
+    schemas = extract_stream(crawled())
+    crawler.join()
+
+    if crash:
+        raise crash[0]
+
+    return schemas
@@ -1,21 +1,85 @@
-from requests import get, RequestException
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from markdownify import markdownify as md
-from urllib.parse import urljoin
-
-from time import sleep
+from urllib.parse import urljoin, urlparse
+
+from fetch import fetch, FetchError
+from browser import default_browser_pool, looks_client_rendered
+from page_cache import PageCache
+from frontier import Frontier
+from discovery import discover, MAX_SITEMAPS
+from html_parse import extract_links, parse_page
+from boilerplate import TemplateDetector
+from dedup import NearDuplicateIndex
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, monotonic
 from tqdm import tqdm
 
 
 failed = 0
 
+DEFAULT_WORKERS = 16
+DEFAULT_HOST_CONNECTIONS = 4
+DEFAULT_HOST_RPS = 8.0
+
+_page_cache: PageCache | None = None
+_use_cache = True
+
+
+def configure_cache(enabled: bool = True, refresh: bool = False, **kwargs) -> None:
+    """Set up the page cache used by the fetch functions below, `refresh` ignores what's cached."""
+    global _page_cache, _use_cache
+
+    _use_cache = enabled
+    _page_cache = PageCache(refresh=refresh, **kwargs) if enabled else None
+
+
+def _cache() -> PageCache | None:
+    global _page_cache
+
+    if _page_cache is None and _use_cache:
+        _page_cache = PageCache()
+
+    return _page_cache
+
 
-def bfs_site(starting_url: str, domain_url="/", auth_info=None, slowdown_s: float = 0.05) -> dict[str, str]:
+class HostBudget:
+    """
+    Politeness budget for a single host.
+
+    Caps the number of requests in flight to the host and spaces request starts
+    so no more than `rps` requests per second are sent, replacing the global
+    sleep between pages.
+    """
+
+    def __init__(self, max_connections: int, rps: float) -> None:
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._interval = 1 / rps if rps > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def __aenter__(self) -> "HostBudget":
+        await self._semaphore.acquire()
+
+        # Claim the next free start slot, then sleep until it arrives.
+        now = monotonic()
+        start = max(now, self._next_slot)
+        self._next_slot = start + self._interval
+
+        if start > now:
+            await asyncio.sleep(start - now)
+
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._semaphore.release()
+
+
+def bfs_site(starting_url: str, domain_url="/", auth_info=None, slowdown_s: float = 0.05,
+             max_depth: int | None = None, max_pages: int | None = None) -> dict[str, str]:
     "Returns all pages found on the given site labeled by URL."
 
     pages = {}
-    links = {starting_url}  # Sets so duplicates get filtered automatically.
+    links = Frontier(max_depth, max_pages)
+    links.add(starting_url)
     failed = 0
 
     base_url = urljoin(starting_url, domain_url)
@@ -29,7 +93,7 @@ def bfs_site(starting_url: str, domain_url="/", auth_info=None, slowdown_s: floa
     )
 
     while links:
-        link = links.pop()
+        link, depth = links.pop()
         # print("Processing", link)
 
         # print(f"{segment}: {len(pages)} pages processed, {len(links)} in queue ({failed} failed).     ", end="\r")
@@ -41,10 +105,11 @@ def bfs_site(starting_url: str, domain_url="/", auth_info=None, slowdown_s: floa
             sleep(slowdown_s)
             continue
 
-        pages[link] = md(html)
+        pages[link], new_links = _process_page(link, html, base_url)
 
-        # Add new links which aren't already processed.
-        links |= get_all_links(html, base_url) - set(pages)
+        # Add new links, the frontier skips everything it has seen before.
+        for new_link in new_links:
+            links.add(new_link, depth + 1)
 
         bar.update(1)
         bar.set_postfix(in_queue=len(links), failed=failed)
@@ -52,52 +117,264 @@ def bfs_site(starting_url: str, domain_url="/", auth_info=None, slowdown_s: floa
         sleep(slowdown_s)  # So we don't accidentaly DoS the docs.
 
     bar.close()
+    if _cache():
+        _cache().save()
+
     print(f"Finished scraping {segment or '/'}: "
           f"{len(pages)} successful, {failed} failed.")
 
     return pages
 
 
-def get_content(url: str, auth_info=None):
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from webdriver_manager.chrome import ChromeDriverManager
-    from selenium.webdriver import Chrome
+def _process_page(url: str, html: str | bytes, base_url: str,
+                  detector: TemplateDetector | None = None) -> tuple[str, set[str]]:
+    """
+    CPU-bound part of handling a page, run off the event loop. Parses the page once at most,
+    with a `detector` boilerplate is stripped before the markdown conversion.
 
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
+    Stripped markdown isn't cached, what gets stripped depends on the pages the detector saw
+    before this one, so it can differ between crawls of the same HTML.
+    """
+    cache = _cache()
+    if detector is not None:
+        return parse_page(html, base_url, detector.strip)
+    if cache is None:
+        return parse_page(html, base_url)
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
+    raw = html.encode("utf-8") if isinstance(html, str) else html
+    text = cache.markdown(url, raw)
 
+    if text is not None:
+        return text, extract_links(html, base_url)
 
-    service = Service(ChromeDriverManager().install())
-    driver = Chrome(service=service, options=chrome_options)
+    text, links = parse_page(html, base_url)
+    cache.put_markdown(url, raw, text)
 
-    try:
-        driver.get(url)
+    return text, links
+
+
+async def _crawl(starting_url: str, domain_url: str, auth_info, workers: int,
+                 host_connections: int, host_rps: float, render_js: bool,
+                 max_depth: int | None, max_pages: int | None,
+                 use_sitemaps: bool, follow_links: bool | None, strip_boilerplate: bool,
+                 dedupe: bool, sink) -> dict[str, str]:
+    pages = {}
+    kept = 0
+    frontier = Frontier(max_depth, max_pages)
+    frontier.add(starting_url)
+    lastmods: dict[str, float | None] = {}
+    in_flight = 0
+    wakeup = asyncio.Condition()  # Signalled whenever the frontier grows or a page finishes.
+    budgets: dict[str, HostBudget] = {}
+    failed = 0
+
+    base_url = urljoin(starting_url, domain_url)
+    segment = domain_url.replace(urljoin(domain_url, "/"), "")
+
+    loop = asyncio.get_running_loop()
+    # Own executor so the pool size matches the worker count instead of the loop default.
+    executor = ThreadPoolExecutor(max_workers=workers)
+    get_page = get_content_auto if render_js else get_content_no_sel
+    detector = TemplateDetector() if strip_boilerplate else None
+    duplicates = NearDuplicateIndex() if dedupe else None
+
+    discovery = None
+    if use_sitemaps:
+        discovery = await loop.run_in_executor(executor, discover, starting_url, base_url)
+
+        for url, lastmod in discovery.urls.items():
+            if frontier.add(url, 1):
+                lastmods[url] = lastmod
+
+        if discovery.crawl_delay:
+            host_rps = min(host_rps, 1 / discovery.crawl_delay) if host_rps > 0 else 1 / discovery.crawl_delay
+
+        print(f"Discovered {len(discovery.urls)} pages from sitemaps"
+              + ("" if discovery.complete else f" (stopped after {MAX_SITEMAPS} sitemaps)")
+              + (f", crawl delay {discovery.crawl_delay}s." if discovery.crawl_delay else "."))
+
+    if follow_links is None:
+        # A sitemap that lists the section already names every page, parsing links only finds the same ones again.
+        # Unless some sitemaps were never read, their pages can only be found through links.
+        follow_links = not (discovery and discovery.urls and discovery.complete)
+
+    bar = tqdm(
+        total=None,
+        desc=f"{segment or '/'} crawl ",
+        unit=" page",
+        leave=False,
+    )
+
+    async def worker():
+        nonlocal failed, in_flight, kept
+
+        while True:
+            async with wakeup:
+                # An empty frontier only means we're done once nothing in flight can add to it.
+                while not frontier and in_flight:
+                    await wakeup.wait()
+
+                if not frontier:
+                    return
+
+                link, depth = frontier.pop()
+                in_flight += 1
+
+            try:
+                # Pages the cache can answer without asking the server don't count against the host's budget.
+                html = _cached_page(link, lastmods.get(link))
+
+                if html is None or (render_js and looks_client_rendered(html)):
+                    budget = budgets.setdefault(urlparse(link).netloc, HostBudget(host_connections, host_rps))
+                    async with budget:
+                        html = await loop.run_in_executor(executor, get_page, link, auth_info, lastmods.get(link))
+
+                if not html:
+                    failed += 1
+                    continue
+
+                text, links = await loop.run_in_executor(executor, _process_page, link, html, base_url, detector)
+                if not follow_links:
+                    links = ()
 
-        WebDriverWait(driver, 100).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
+                # A copy of a page we already have still gets its links followed, it just isn't kept.
+                if duplicates is None or await loop.run_in_executor(executor, duplicates.add, link, text) is None:
+                    kept += 1
+                    if sink is None:
+                        pages[link] = text
+                    else:
+                        # A sink that blocks (full queue downstream) holds this worker, slowing the crawl down.
+                        await loop.run_in_executor(executor, sink, link, text)
 
-        content = driver.page_source
+                for new_link in links:
+                    if discovery is None or discovery.allowed(new_link):
+                        frontier.add(new_link, depth + 1)
+
+                bar.update(1)
+            except Exception:
+                failed += 1
+            finally:
+                async with wakeup:
+                    in_flight -= 1
+                    wakeup.notify_all()
+
+                bar.set_postfix(in_queue=len(frontier), failed=failed)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+
+    try:
+        await asyncio.gather(*tasks)
     finally:
-        driver.quit()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=False)
+        bar.close()
+
+        if _cache():
+            _cache().save()
+
+    print(f"Finished scraping {segment or '/'}: "
+          f"{kept} successful, {failed} failed.")
+    if detector and detector.pages:
+        print(detector.report())
+    if duplicates and duplicates.dropped:
+        print(duplicates.report())
+
+    return pages
 
-    return content
 
+def crawl_site(starting_url: str, domain_url="/", auth_info=None,
+               workers: int = DEFAULT_WORKERS,
+               host_connections: int = DEFAULT_HOST_CONNECTIONS,
+               host_rps: float = DEFAULT_HOST_RPS,
+               render_js: bool = False,
+               max_depth: int | None = None,
+               max_pages: int | None = None,
+               use_sitemaps: bool = True,
+               follow_links: bool | None = None,
+               strip_boilerplate: bool = True,
+               dedupe: bool = False,
+               sink=None) -> dict[str, str]:
+    """
+    Concurrent version of `bfs_site`, returns all pages found on the given site labeled by URL.
+
+    Up to `workers` pages are fetched at the same time, limited per host to
+    `host_connections` open requests and `host_rps` requests per second.
+    With `render_js` pages that look client-rendered are rendered in the shared browser pool.
+    Pages are fetched likely-endpoint-pages first, `max_depth` and `max_pages` cut the crawl off.
+
+    With `use_sitemaps` the crawl is seeded from robots.txt and the site's sitemaps, robots.txt
+    rules and its Crawl-delay are honored, and cached pages the sitemap says haven't changed
+    since are not requested at all. Links on pages are only followed when no sitemap listed
+    the section or not every sitemap was read, unless `follow_links` says otherwise.
+
+    With `strip_boilerplate` navigation, footers and blocks repeated across the site's
+    pages are removed before the markdown conversion, see `TemplateDetector`. With `dedupe`
+    only the first page of every cluster of near-identical pages documenting the same
+    endpoints is kept.
+
+    With a `sink`, every kept page is passed to `sink(url, markdown)` as soon as it's ready
+    instead of being collected, and an empty dict is returned. The sink is called from
+    worker threads and may block to push back on the crawl.
+    """
+    return asyncio.run(_crawl(starting_url, domain_url, auth_info, workers, host_connections, host_rps,
+                              render_js, max_depth, max_pages, use_sitemaps, follow_links,
+                              strip_boilerplate, dedupe, sink))
 
-def get_content_no_sel(url: str, auth_info=None) -> str:
+
+def get_content(url: str, auth_info=None):
+    return default_browser_pool().render(url)
+
+
+def get_content_auto(url: str, auth_info=None, modified_at: float | None = None) -> str:
+    """Plain fetch first, only pages that look client-rendered go through the browser."""
+    html = get_content_no_sel(url, auth_info, modified_at)
+
+    if not html or not looks_client_rendered(html):
+        return html
+
+    try:
+        return get_content(url, auth_info)
+    except Exception:
+        return html  # The shell is still better than nothing.
+
+
+def _cached_page(url: str, modified_at: float | None = None) -> bytes | None:
+    """
+    Cached body of `url` if it can be used without asking the server: it's still fresh, or
+    it was fetched after `modified_at`, the last time the page changed (sitemap lastmod).
+    """
+    cache = _cache()
+    entry = cache.get(url) if cache else None
+
+    if entry and (cache.is_fresh(entry) or (modified_at is not None and entry.fetched_at >= modified_at)):
+        return cache.html(entry)
+
+    return None
+
+
+def get_content_no_sel(url: str, auth_info=None, modified_at: float | None = None) -> str:
     # Still can't get selenium working with Nix...
     global failed
 
+    cached = _cached_page(url, modified_at)
+    if cached is not None:
+        return cached
+
+    cache = _cache()
+    entry = cache.get(url) if cache else None
+
     try:
-        r = get(url)
+        r = fetch(url, cache.validators(entry) if entry else None)
+
+        if r.status_code == 304 and entry:
+            cached = cache.html(entry)
+            if cached is not None:
+                cache.revalidated(entry)
+                return cached
+
+            r = fetch(url)  # Body got evicted in the meantime, ask for it unconditionally.
 
         if not r.status_code == 200:
             # print(f"Couldn't access page: {url} (HTTP {r.status_code})")
@@ -105,8 +382,11 @@ def get_content_no_sel(url: str, auth_info=None) -> str:
 
             return ""
 
+        if cache:
+            cache.put(url, r.content, r.headers)
+
         return r.content
-    except RequestException as e:
+    except FetchError as e:
         # print(f"Couldn't access page: {url}, {e}")
         failed += 1
 
@@ -114,9 +394,4 @@ def get_content_no_sel(url: str, auth_info=None) -> str:
 
 
 def get_all_links(html: str, base_url: str) -> set[str]:
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # '/page/1#Header-2' -> 'https://full-url.com/page/1' (and doesn't fuck up on already full URLs.)
-    links = {urljoin(base_url, a.get('href')).split('#')[0] for a in soup.find_all('a')}
-
-    return {l for l in links if l.startswith(base_url)}
+    return extract_links(html, base_url)
@@ -0,0 +1,51 @@
+from bs4 import BeautifulSoup
+
+from boilerplate import TemplateDetector
+
+SIDEBAR = '<aside class="sidebar"><ul><li>Getting started</li><li>Authentication</li><li>Rate limits</li></ul></aside>'
+SHARED = ("<p>All requests need a bearer token in the Authorization header.</p>"
+          "<table><tr><td>limit</td><td>Number of items to return, at most 50.</td></tr></table>")
+
+
+def _page(i):
+    return (f"<html><body>{SIDEBAR}<main><h1>Get thing {i}</h1><code>GET /v1/things/{i}</code>"
+            f"<section>{SHARED}</section></main></body></html>")
+
+
+def _strip_all(detector, n):
+    texts = []
+    for i in range(n):
+        soup = BeautifulSoup(_page(i), "html.parser")
+        detector.strip(soup)
+        texts.append(soup.get_text(" ", strip=True))
+
+    return texts
+
+
+def test_repeated_chrome_is_stripped():
+    last = _strip_all(TemplateDetector(), 5)[-1]
+
+    assert "Getting started" not in last
+    assert "GET /v1/things/4" in last
+
+
+def test_shared_docs_in_the_content_root_are_kept():
+    for text in _strip_all(TemplateDetector(), 5):
+        assert "bearer token" in text
+        assert "at most 50" in text
+
+
+def test_endpoints_named_after_consents_are_kept():
+    html = """<html><body class="has-cookie-banner"><div id="cookie-banner">We use cookies. Accept all?</div>
+    <main><h1>Consents</h1>
+    <section id="create-a-consent"><h2>Create a consent</h2><code>POST /v1/consents</code>
+    <table><tr><td>permissions</td><td>The data the consent covers.</td></tr></table></section>
+    <section id="list-cookies"><h2>List cookies</h2><code>GET /v1/cookies</code>
+    <p>Lists the cookies stored for a consent.</p></section></main></body></html>"""
+    soup = BeautifulSoup(html, "html.parser")
+    TemplateDetector().strip(soup)
+    text = soup.get_text(" ", strip=True)
+
+    assert "We use cookies" not in text
+    assert "POST /v1/consents" in text and "The data the consent covers." in text
+    assert "GET /v1/cookies" in text
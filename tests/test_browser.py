@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from browser import BrowserPool
+
+
+class BrokenDriver:
+    """Starts fine, but every page load fails."""
+
+    def __init__(self):
+        self.quit_calls = 0
+
+    def set_page_load_timeout(self, timeout_s):
+        pass
+
+    def get(self, url):
+        time.sleep(0.2)  # Long enough for every thread to be queued up for a driver.
+        raise TimeoutError(f"Timed out loading {url}")
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+def test_waiters_replace_discarded_drivers():
+    drivers = []
+
+    def factory():
+        drivers.append(BrokenDriver())
+        return drivers[-1]
+
+    pool = BrowserPool(size=2, driver_factory=factory, timeout_s=1)
+    errors = []
+
+    def render():
+        try:
+            pool.render("https://docs.example.com")
+        except TimeoutError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render, daemon=True) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads), "render() hung waiting for a driver"
+    assert len(errors) == 6
+    assert len(drivers) == 6 and all(driver.quit_calls == 1 for driver in drivers)
+
+
+def test_factory_errors_free_the_slot():
+    def factory():
+        raise RuntimeError("Chrome failed to start")
+
+    pool = BrowserPool(size=1, driver_factory=factory)
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            pool._acquire()
@@ -0,0 +1,35 @@
+from gen import resilience
+from gen.backends import StubBackend, StubRateLimitError
+from gen.chunker import chunk_spans, ENCODER
+from gen.limit_utils import SlidingWindowRateLimiter
+from gen.token_index import TokenIndex
+
+# A code block is never cut on structure, so only the model can split it.
+PAGE = "\n".join(["```", *(f"thing_{i} = client.get('/v1/things/{i}')" for i in range(400)), "```"])
+
+
+class FlakySplitBackend(StubBackend):
+    """Rate limited on the first call, then answers without a usable split line."""
+
+    attempts = 0
+
+    def complete(self, messages, response_format=None, temperature=None):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise StubRateLimitError(0.01)
+
+        return super().complete(messages, response_format, temperature)
+
+
+def test_split_calls_retry_and_fall_back_to_the_middle(monkeypatch):
+    monkeypatch.setattr(resilience, "BASE_DELAY_S", 0)
+    index = TokenIndex(PAGE, ENCODER)
+    backend = FlakySplitBackend(answer=lambda messages, response_format: '{"split_line": "the end"}')
+    limiter = SlidingWindowRateLimiter(tpm_limit=1_000_000)
+
+    spans = chunk_spans(index, 1000, backend, context_tokens=200, limiter=limiter)
+
+    assert backend.attempts == backend.calls + 1 > 2
+    assert spans[0][0] == 0 and spans[-1][1] == len(index.lines)
+    assert all(start < end for start, end in spans)
+    assert all(end == start for (_, end), (start, _) in zip(spans, spans[1:]))
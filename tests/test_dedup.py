@@ -0,0 +1,25 @@
+from dedup import deduplicate
+
+# Generated reference pages: a few words about the endpoint, then the same long tables on every page.
+ERRORS = "\n".join(f"| {400 + i} | error_{i} | The request failed with error {i}, see the guides. |" for i in range(40))
+
+
+def _page(name, path):
+    return f"# Get {name}\n\nGET /v1/{path}/{{id}}\n\nThe Spotify ID of the {name}.\n\n## Errors\n\n{ERRORS}\n"
+
+
+def test_templated_endpoint_pages_are_kept():
+    pages = {f"https://docs.example.com/get-{name}": _page(name, f"{name}s") for name in ("artist", "show", "playlist")}
+    kept, index = deduplicate(pages)
+
+    assert list(kept) == list(pages)
+    assert index.dropped == 0
+
+
+def test_copies_of_one_endpoint_page_are_dropped():
+    pages = {"https://docs.example.com/get-artist": _page("artist", "artists"),
+             "https://docs.example.com/v2/get-artist": _page("artist", "artists") + "\nWas this page helpful?\n"}
+    kept, index = deduplicate(pages)
+
+    assert list(kept) == ["https://docs.example.com/get-artist"]
+    assert index.clusters == {"https://docs.example.com/get-artist": ["https://docs.example.com/v2/get-artist"]}
@@ -0,0 +1,45 @@
+import gzip
+
+import discovery
+from fetch import Response
+
+ROOT = "https://docs.example.com/"
+
+
+def _sitemap(pages=(), sitemaps=()):
+    entries = [f"<url><loc>{ROOT}api/{page}</loc></url>" for page in pages]
+    entries += [f"<sitemap><loc>{ROOT}sitemaps/{name}.xml</loc></sitemap>" for name in sitemaps]
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{"".join(entries)}</urlset>'.encode()
+
+
+def _serve(monkeypatch, files):
+    monkeypatch.setattr(discovery, "_get", lambda url: files.get(url.removeprefix(ROOT)))
+
+
+def test_discovery_is_complete_when_every_sitemap_was_read(monkeypatch):
+    _serve(monkeypatch, {"sitemap.xml": _sitemap(sitemaps=["a", "b"]),
+                         "sitemaps/a.xml": _sitemap(pages=["users"]), "sitemaps/b.xml": _sitemap(pages=["orders"])})
+    found = discovery.discover(ROOT, ROOT + "api/")
+
+    assert sorted(found.urls) == [ROOT + "api/orders", ROOT + "api/users"]
+    assert found.complete
+
+
+def test_discovery_is_incomplete_past_the_sitemap_limit(monkeypatch):
+    names = [str(i) for i in range(discovery.MAX_SITEMAPS + 10)]
+    files = {f"sitemaps/{name}.xml": _sitemap(pages=[name]) for name in names}
+    _serve(monkeypatch, {"sitemap.xml": _sitemap(sitemaps=names), **files})
+    found = discovery.discover(ROOT, ROOT + "api/")
+
+    assert len(found.urls) == discovery.MAX_SITEMAPS - 1
+    assert not found.complete
+
+
+def test_broken_gzip_sitemaps_are_skipped(monkeypatch):
+    compressed = gzip.compress(_sitemap(pages=["users"]))
+    bodies = {"sitemap.xml": _sitemap(sitemaps=["broken", "ok"]), "sitemaps/broken.xml": compressed[:-12],
+              "sitemaps/ok.xml": compressed}
+    monkeypatch.setattr(discovery, "fetch", lambda url: Response(url, 200, bodies.get(url.removeprefix(ROOT), b""), {}))
+    found = discovery.discover(ROOT, ROOT + "api/")
+
+    assert list(found.urls) == [ROOT + "api/users"]
@@ -0,0 +1,41 @@
+from gen.merge import EndpointIndex, premerge
+
+
+def _endpoint(name, url, method="GET"):
+    return {"name": name, "url": url, "args_in_url": False, "method": method,
+            "input_parameters": [], "output_parameters": [], "description": name}
+
+
+def test_endpoints_that_differ_by_query_are_kept_apart():
+    index = EndpointIndex([_endpoint("Query pages", "https://en.wikipedia.org/w/api.php?action=query"),
+                           _endpoint("Parse page", "https://en.wikipedia.org/w/api.php?action=parse")])
+
+    assert sorted((e["name"], e["url"]) for e in index.endpoints()) == [
+        ("Parse page", "https://en.wikipedia.org/w/api.php?action=parse"),
+        ("Query pages", "https://en.wikipedia.org/w/api.php?action=query")]
+
+
+def test_duplicates_keep_their_query():
+    index = EndpointIndex([_endpoint("Search", "https://api.x.com/v1/search?type=track&limit=10"),
+                           _endpoint("Search", "/v1/search/?limit=10&type=track")])
+
+    assert [e["url"] for e in index.endpoints()] == ["https://api.x.com/v1/search?type=track&limit=10"]
+
+
+def _info(name, type_="string", default="None"):
+    return {"var_name": name, "type": type_, "default_val": default, "explanation": f"The {name}."}
+
+
+def test_only_exact_name_matches_are_merged_without_the_model():
+    merged, ambiguous = premerge([_info("webhook_secret"), _info("webhookSecret"), _info("webhook_secret_id"),
+                                  _info("personal_access_token"), _info("personal_access_token_id")])
+
+    assert merged == []
+    assert [sorted(item["var_name"] for item in group.conflict()) for group in ambiguous] == [
+        ["webhook_secret", "webhook_secret_id"], ["personal_access_token", "personal_access_token_id"]]
+
+
+def test_consistent_exact_groups_are_merged():
+    merged, ambiguous = premerge([_info("api_key"), _info("API-Key"), _info("apiKeys")])
+
+    assert [item["var_name"] for item in merged] == ["api_key"] and ambiguous == []
@@ -0,0 +1,24 @@
+from page_cache import PageCache
+
+HTML = b"<html><body><h1>Get thing</h1><code>GET /v1/thing</code></body></html>"
+
+
+def test_overwriting_markdown_keeps_the_size_total(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("https://docs.example.com/thing", HTML, {})
+
+    for text in ("# Get thing\n\n`GET /v1/thing`", "# Get thing\n\nGET /v1/thing", "# Get thing"):
+        cache.put_markdown("https://docs.example.com/thing", HTML, text)
+
+    assert cache._total == len(HTML) + len("# Get thing")
+    assert cache._total == sum(entry.size for entry in cache._entries.values())
+
+
+def test_refetching_the_same_body_keeps_its_markdown_counted(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("https://docs.example.com/thing", HTML, {})
+    cache.put_markdown("https://docs.example.com/thing", HTML, "# Get thing")
+    cache.put("https://docs.example.com/thing", HTML, {"etag": '"v2"'})
+
+    assert cache.markdown("https://docs.example.com/thing", HTML) == "# Get thing"
+    assert cache._total == len(HTML) + len("# Get thing")
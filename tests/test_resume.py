@@ -0,0 +1,37 @@
+import pytest
+
+from gen import gen
+from gen.backends import StubBackend
+from gen.journal import RunJournal
+
+
+class FailingBackend(StubBackend):
+    def complete(self, messages, response_format=None, temperature=None):
+        raise RuntimeError("Connection dropped")
+
+
+def _pages(numbers):
+    return {f"https://docs.example.com/thing{i}": f"# Thing {i}\n\nGET /v1/thing{i}\n" for i in numbers}
+
+
+def _urls(schemas):
+    return sorted(endpoint["url"] for endpoint in schemas["endpoints"])
+
+
+def test_resume_keeps_pages_answered_by_the_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Store, journal and tmp.json all live in the working directory.
+    gen.set_backend(StubBackend())
+
+    # An earlier run already extracted the first four pages.
+    gen.extract_schemas(_pages(range(4)))
+
+    # This run gets the other two from the model, and dies doing so.
+    journal = RunJournal.start({})
+    gen.set_backend(FailingBackend())
+    with pytest.raises(RuntimeError):
+        gen.extract_schemas(_pages(range(6)), journal)
+
+    gen.set_backend(StubBackend())
+    resumed = gen.extract_schemas(_pages(range(6)), RunJournal.resume(journal.run_id))
+
+    assert _urls(resumed) == [f"/v1/thing{i}" for i in range(6)]